@@ -0,0 +1,465 @@
+"""Потоковая выгрузка списка покупок в разных форматах."""
+import csv
+import struct
+import zlib
+from functools import lru_cache
+
+from django.conf import settings
+
+SUBSET_TABLES = (
+    'cvt ', 'fpgm', 'glyf', 'head', 'hhea', 'hmtx', 'loca', 'maxp', 'prep'
+)
+ARGS_ARE_WORDS = 0x0001
+HAS_SCALE = 0x0008
+MORE_COMPONENTS = 0x0020
+HAS_XY_SCALE = 0x0040
+HAS_TWO_BY_TWO = 0x0080
+
+
+class ShoppingListExporter:
+    """Базовый класс выгрузки списка покупок.
+
+    Метод stream получает итератор строк (название, единица измерения,
+    количество) и по мере чтения отдаёт байты файла.
+    """
+
+    content_type = None
+    extension = None
+    title = 'Список покупок'
+
+    def stream(self, items):
+        raise NotImplementedError
+
+
+class TxtExporter(ShoppingListExporter):
+    """Выгрузка в текстовый файл."""
+
+    content_type = 'text/plain; charset=utf-8'
+    extension = 'txt'
+
+    def stream(self, items):
+        yield f'{self.title}:\n'.encode()
+        for name, measurement_unit, amount in items:
+            yield f'{name}: {amount} {measurement_unit}\n'.encode()
+
+
+class Echo:
+    """Буфер для csv.writer, возвращающий записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+class CsvExporter(ShoppingListExporter):
+    """Выгрузка в CSV."""
+
+    content_type = 'text/csv; charset=utf-8'
+    extension = 'csv'
+
+    def stream(self, items):
+        writer = csv.writer(Echo())
+        yield '\ufeff'.encode()
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        ).encode()
+        for name, measurement_unit, amount in items:
+            yield writer.writerow((name, amount, measurement_unit)).encode()
+
+
+class TrueTypeFont:
+    """Метрики и таблица символов TrueType-шрифта для встраивания в PDF."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as font_file:
+            self.data = font_file.read()
+        num_tables, = struct.unpack_from('>H', self.data, 4)
+        self.tables = {}
+        self.table_lengths = {}
+        for index in range(num_tables):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', self.data, 12 + 16 * index
+            )
+            tag = tag.decode('latin-1')
+            self.tables[tag] = offset
+            self.table_lengths[tag] = length
+        head = self.tables['head']
+        self.units_per_em, = struct.unpack_from('>H', self.data, head + 18)
+        self.bbox = struct.unpack_from('>4h', self.data, head + 36)
+        hhea = self.tables['hhea']
+        self.ascent, self.descent = struct.unpack_from(
+            '>2h', self.data, hhea + 4
+        )
+        num_metrics, = struct.unpack_from('>H', self.data, hhea + 34)
+        self.advances = [
+            struct.unpack_from('>H', self.data, self.tables['hmtx'] + 4 * i)[0]
+            for i in range(num_metrics)
+        ]
+        self.num_glyphs, = struct.unpack_from(
+            '>H', self.data, self.tables['maxp'] + 4
+        )
+        self.long_loca, = struct.unpack_from('>h', self.data, head + 50)
+        self.cmap = self.find_cmap()
+        self.glyph_ids = {}
+
+    def find_cmap(self):
+        cmap = self.tables['cmap']
+        num_subtables, = struct.unpack_from('>H', self.data, cmap + 2)
+        for index in range(num_subtables):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', self.data, cmap + 4 + 8 * index
+            )
+            subtable = cmap + offset
+            subtable_format, = struct.unpack_from('>H', self.data, subtable)
+            if (platform, encoding, subtable_format) == (3, 1, 4):
+                return subtable
+        raise ValueError('В шрифте нет таблицы символов Unicode BMP.')
+
+    def glyph_id(self, char):
+        if char not in self.glyph_ids:
+            self.glyph_ids[char] = self.find_glyph_id(ord(char))
+        return self.glyph_ids[char]
+
+    def find_glyph_id(self, code):
+        """Номер глифа по таблице символов формата 4."""
+        if code > 0xFFFF:
+            return 0
+        seg_count = struct.unpack_from('>H', self.data, self.cmap + 6)[0] // 2
+        end_codes = self.cmap + 14
+        start_codes = end_codes + 2 * seg_count + 2
+        id_deltas = start_codes + 2 * seg_count
+        id_range_offsets = id_deltas + 2 * seg_count
+        for segment in range(seg_count):
+            end, = struct.unpack_from('>H', self.data, end_codes + 2 * segment)
+            if code > end:
+                continue
+            start, = struct.unpack_from(
+                '>H', self.data, start_codes + 2 * segment
+            )
+            if code < start:
+                return 0
+            delta, = struct.unpack_from(
+                '>h', self.data, id_deltas + 2 * segment
+            )
+            range_offset_position = id_range_offsets + 2 * segment
+            range_offset, = struct.unpack_from(
+                '>H', self.data, range_offset_position
+            )
+            if not range_offset:
+                return (code + delta) & 0xFFFF
+            glyph, = struct.unpack_from(
+                '>H', self.data,
+                range_offset_position + range_offset + 2 * (code - start)
+            )
+            return (glyph + delta) & 0xFFFF if glyph else 0
+        return 0
+
+    def width(self, glyph):
+        advance = self.advances[min(glyph, len(self.advances) - 1)]
+        return advance * 1000 // self.units_per_em
+
+    def scale(self, value):
+        return value * 1000 // self.units_per_em
+
+    def table(self, tag):
+        offset = self.tables[tag]
+        return self.data[offset:offset + self.table_lengths[tag]]
+
+    def glyph_location(self, glyph):
+        """Начало и конец описания глифа в таблице glyf."""
+        loca = self.tables['loca']
+        if self.long_loca:
+            start, end = struct.unpack_from('>2I', self.data, loca + 4 * glyph)
+        else:
+            start, end = (
+                2 * offset for offset in
+                struct.unpack_from('>2H', self.data, loca + 2 * glyph)
+            )
+        glyf = self.tables['glyf']
+        return glyf + start, glyf + end
+
+    def components(self, glyph):
+        """Номера глифов, из которых собран составной глиф."""
+        start, end = self.glyph_location(glyph)
+        if end - start < 10:
+            return
+        contours, = struct.unpack_from('>h', self.data, start)
+        if contours >= 0:
+            return
+        position = start + 10
+        flags = MORE_COMPONENTS
+        while flags & MORE_COMPONENTS:
+            flags, component = struct.unpack_from('>2H', self.data, position)
+            yield component
+            position += 8 if flags & ARGS_ARE_WORDS else 6
+            if flags & HAS_SCALE:
+                position += 2
+            elif flags & HAS_XY_SCALE:
+                position += 4
+            elif flags & HAS_TWO_BY_TWO:
+                position += 8
+
+    def subset(self, glyphs):
+        """Файл шрифта только с контурами glyphs.
+
+        Номера глифов сохраняются, поэтому в PDF остаётся
+        /CIDToGIDMap /Identity: контуры остальных глифов просто
+        опускаются, а таблицы, не нужные для вывода (cmap, name, post,
+        таблицы кернинга и лигатур), не встраиваются.
+        """
+        kept = {0}
+        pending = list(glyphs)
+        while pending:
+            glyph = pending.pop()
+            if glyph not in kept and glyph < self.num_glyphs:
+                kept.add(glyph)
+                pending.extend(self.components(glyph))
+        glyf = bytearray()
+        loca = []
+        for glyph in range(self.num_glyphs):
+            loca.append(len(glyf))
+            if glyph in kept:
+                start, end = self.glyph_location(glyph)
+                glyf += self.data[start:end]
+                glyf += bytes(-len(glyf) % 4)
+        loca.append(len(glyf))
+        head = bytearray(self.table('head'))
+        head[8:12] = bytes(4)
+        head[50:52] = struct.pack('>h', 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES if tag in self.tables
+        }
+        tables.update(
+            head=bytes(head),
+            glyf=bytes(glyf),
+            loca=struct.pack(f'>{len(loca)}I', *loca)
+        )
+        return font_file(tables)
+
+
+def table_checksum(data):
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def font_file(tables):
+    """Собирает TrueType-файл из таблиц."""
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    header = struct.pack(
+        '>I4H', 0x00010000, count, 16 * power, power.bit_length() - 1,
+        16 * (count - power)
+    )
+    offset = len(header) + 16 * count
+    directory, body = [], []
+    for tag in sorted(tables):
+        data = tables[tag] + bytes(-len(tables[tag]) % 4)
+        directory.append(struct.pack(
+            '>4s3I', tag.encode('latin-1'), table_checksum(data), offset,
+            len(tables[tag])
+        ))
+        body.append(data)
+        offset += len(data)
+    return header + b''.join(directory) + b''.join(body)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    return TrueTypeFont(path)
+
+
+class PdfExporter(ShoppingListExporter):
+    """Выгрузка в PDF со встроенным TrueType-шрифтом.
+
+    Документ пишется по страницам: страница отдаётся клиенту, как только
+    набрано lines_per_page строк. Объекты шрифта и дерево страниц
+    дописываются в конце, так как зависят от использованных глифов.
+    """
+
+    content_type = 'application/pdf'
+    extension = 'pdf'
+    page_width = 595
+    page_height = 842
+    margin = 50
+    font_size = 12
+    leading = 16
+    lines_per_page = 46
+    # Метка подмножества шрифта: шесть заглавных латинских букв и «+».
+    FONT_NAME = 'FGLIST+ShoppingListFont'
+
+    CATALOG, PAGES, FONT, CID_FONT, DESCRIPTOR, FONT_FILE, TO_UNICODE = (
+        range(1, 8)
+    )
+
+    def __init__(self):
+        self.font = load_font(settings.SHOPPING_LIST_FONT)
+        self.glyphs = {}
+        self.offsets = {}
+        self.position = 0
+        self.next_object = self.TO_UNICODE + 1
+        self.pages = []
+
+    def stream(self, items):
+        yield self.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield self.write_object(
+            self.CATALOG,
+            f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'.encode()
+        )
+        lines = []
+        for line in self.text_lines(items):
+            for row in self.wrap(line):
+                lines.append(row)
+                if len(lines) == self.lines_per_page:
+                    yield self.write_page(lines)
+                    lines = []
+        if lines or not self.pages:
+            yield self.write_page(lines)
+        yield self.write_font()
+        yield self.write_trailer()
+
+    def text_lines(self, items):
+        yield f'{self.title}:'
+        yield ''
+        for name, measurement_unit, amount in items:
+            yield f'{name}: {amount} {measurement_unit}'
+
+    def text_width(self, text):
+        return sum(self.font.width(self.font.glyph_id(char)) for char in text)
+
+    def wrap(self, line):
+        """Разбивает строку по словам на строки не шире поля страницы.
+
+        Слово, которое не помещается целиком, переносится по символам.
+        """
+        max_width = (
+            (self.page_width - 2 * self.margin) * 1000 // self.font_size
+        )
+        rows = ['']
+        for word in line.split(' '):
+            candidate = f'{rows[-1]} {word}' if rows[-1] else word
+            if self.text_width(candidate) <= max_width:
+                rows[-1] = candidate
+                continue
+            if rows[-1]:
+                rows.append('')
+            for char in word:
+                if rows[-1] and self.text_width(rows[-1] + char) > max_width:
+                    rows.append('')
+                rows[-1] += char
+        return rows
+
+    def write(self, chunk):
+        self.position += len(chunk)
+        return chunk
+
+    def write_object(self, number, body):
+        self.offsets[number] = self.position
+        return self.write(
+            f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+        )
+
+    def write_stream(self, number, content, extra=''):
+        return self.write_object(
+            number,
+            f'<< /Length {len(content)}{extra} >>\nstream\n'.encode()
+            + content + b'\nendstream'
+        )
+
+    def encode_line(self, line):
+        glyphs = []
+        for char in line:
+            glyph = self.font.glyph_id(char)
+            self.glyphs.setdefault(glyph, char)
+            glyphs.append(f'{glyph:04X}')
+        return ''.join(glyphs)
+
+    def write_page(self, lines):
+        top = self.page_height - self.margin - self.font_size
+        text = ''.join(f'<{self.encode_line(line)}> Tj T*\n' for line in lines)
+        content = zlib.compress((
+            f'BT\n/F1 {self.font_size} Tf\n{self.leading} TL\n'
+            f'{self.margin} {top} Td\n{text}ET'
+        ).encode())
+        content_number, page_number = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self.pages.append(page_number)
+        return self.write_stream(
+            content_number, content, ' /Filter /FlateDecode'
+        ) + self.write_object(page_number, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R '
+            f'/MediaBox [0 0 {self.page_width} {self.page_height}] '
+            f'/Resources << /Font << /F1 {self.FONT} 0 R >> >> '
+            f'/Contents {content_number} 0 R >>'
+        ).encode())
+
+    def write_font(self):
+        font = self.font
+        glyphs = sorted(self.glyphs)
+        font_data = font.subset(glyphs)
+        widths = ' '.join(f'{glyph} [{font.width(glyph)}]' for glyph in glyphs)
+        bbox = ' '.join(str(font.scale(value)) for value in font.bbox)
+        to_unicode = ''.join(
+            f'<{glyph:04X}> <{ord(self.glyphs[glyph]):04X}>\n'
+            for glyph in glyphs
+        )
+        cmap = (
+            '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+            '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+            '/Supplement 0 >> def\n/CMapName /Adobe-Identity-UCS def\n'
+            '/CMapType 2 def\n1 begincodespacerange\n<0000> <FFFF>\n'
+            'endcodespacerange\n'
+            f'{len(glyphs)} beginbfchar\n{to_unicode}endbfchar\n'
+            'endcmap\nCMapName currentdict /CMap defineresource pop\n'
+            'end\nend'
+        ).encode()
+        kids = ' '.join(f'{page} 0 R' for page in self.pages)
+        return b''.join((
+            self.write_object(self.PAGES, (
+                f'<< /Type /Pages /Kids [{kids}] '
+                f'/Count {len(self.pages)} >>'
+            ).encode()),
+            self.write_object(self.FONT, (
+                '<< /Type /Font /Subtype /Type0 '
+                f'/BaseFont /{self.FONT_NAME} '
+                '/Encoding /Identity-H '
+                f'/DescendantFonts [{self.CID_FONT} 0 R] '
+                f'/ToUnicode {self.TO_UNICODE} 0 R >>'
+            ).encode()),
+            self.write_object(self.CID_FONT, (
+                '<< /Type /Font /Subtype /CIDFontType2 '
+                f'/BaseFont /{self.FONT_NAME} /CIDSystemInfo << '
+                '/Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+                f'/FontDescriptor {self.DESCRIPTOR} 0 R '
+                f'/W [{widths}] /CIDToGIDMap /Identity >>'
+            ).encode()),
+            self.write_object(self.DESCRIPTOR, (
+                f'<< /Type /FontDescriptor /FontName /{self.FONT_NAME} '
+                f'/Flags 32 /FontBBox [{bbox}] /ItalicAngle 0 '
+                f'/Ascent {font.scale(font.ascent)} '
+                f'/Descent {font.scale(font.descent)} '
+                f'/CapHeight {font.scale(font.ascent)} /StemV 80 '
+                f'/FontFile2 {self.FONT_FILE} 0 R >>'
+            ).encode()),
+            self.write_stream(
+                self.FONT_FILE, zlib.compress(font_data),
+                f' /Length1 {len(font_data)} /Filter /FlateDecode'
+            ),
+            self.write_stream(self.TO_UNICODE, cmap),
+        ))
+
+    def write_trailer(self):
+        xref_position = self.position
+        size = self.next_object
+        entries = ''.join(
+            f'{self.offsets[number]:010d} 00000 n \n'
+            for number in range(1, size)
+        )
+        return self.write((
+            f'xref\n0 {size}\n0000000000 65535 f \n{entries}'
+            f'trailer\n<< /Size {size} /Root {self.CATALOG} 0 R >>\n'
+            f'startxref\n{xref_position}\n%%EOF\n'
+        ).encode())
+
+
+SHOPPING_LIST_EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (TxtExporter, CsvExporter, PdfExporter)
+}
@@ -1,18 +1,87 @@
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
 from recipe.models import Ingredients, Recipe
+from recipe.search import search_recipes
+from recipe.tag_registry import get_tag_slug_map
+from rest_framework.filters import OrderingFilter
+
+# Наибольший id BigAutoField: большие числа не помещаются в запрос.
+MAX_ID = 2 ** 63 - 1
+
+
+class ValueListField(forms.Field):
+    """Поле списка значений из повторяющегося параметра запроса."""
+
+    widget = forms.MultipleHiddenInput
+
+    def to_python(self, value):
+        return [item for item in value or [] if item != '']
+
+
+class IntegerListField(ValueListField):
+    """Поле списка целых чисел из повторяющегося параметра запроса."""
+
+    default_error_messages = {
+        'invalid': 'Укажите целые числа.',
+        'out_of_range': 'Укажите числа от %(min_value)s до %(max_value)s.',
+    }
+
+    def __init__(self, *, min_value=None, max_value=None, **kwargs):
+        self.min_value = min_value
+        self.max_value = max_value
+        super().__init__(**kwargs)
+
+    def to_python(self, value):
+        try:
+            return [int(item) for item in super().to_python(value)]
+        except (TypeError, ValueError):
+            raise forms.ValidationError(
+                self.error_messages['invalid'], code='invalid'
+            )
+
+    def validate(self, value):
+        super().validate(value)
+        if any(
+            self.min_value is not None and item < self.min_value
+            or self.max_value is not None and item > self.max_value
+            for item in value
+        ):
+            raise forms.ValidationError(
+                self.error_messages['out_of_range'],
+                code='out_of_range',
+                params={'min_value': self.min_value,
+                        'max_value': self.max_value}
+            )
+
+
+class ValueListFilter(filters.Filter):
+    """Фильтр по нескольким значениям параметра."""
+
+    field_class = ValueListField
+
+
+class IntegerInFilter(ValueListFilter):
+    """Фильтр по нескольким значениям: ?author=1&author=7."""
+
+    field_class = IntegerListField
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('lookup_expr', 'in')
+        super().__init__(*args, **kwargs)
 
 
 class RecipeFilter(filters.FilterSet):
     """Фильтр рецептов."""
 
-    author = filters.CharFilter(
-        field_name='author__id',
-        lookup_expr='icontains'
+    author = IntegerInFilter(
+        field_name='author_id', min_value=1, max_value=MAX_ID
     )
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    tags = ValueListFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='filter_is_in_shopping_cart')
+    search = filters.CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
@@ -20,9 +89,26 @@ class RecipeFilter(filters.FilterSet):
             'author',
             'tags',
             'is_favorited',
-            'is_in_shopping_cart'
+            'is_in_shopping_cart',
+            'search',
         )
 
+    def filter_tags(self, queryset, name, value):
+        slug_map = get_tag_slug_map()
+        tag_ids = [slug_map[slug] for slug in value if slug in slug_map]
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'), tag_id__in=tag_ids
+            )
+        ))
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
     def filter_is_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(favorite_recipe__user=self.request.user)
@@ -34,6 +120,19 @@ class RecipeFilter(filters.FilterSet):
         return queryset
 
 
+class RecipeOrderingFilter(OrderingFilter):
+    """?ordering= с id в конце, чтобы рецепты с равными счётчиками не
+    переставлялись между страницами; порядок совпадает с индексами
+    (поле, id) модели Recipe."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        last = ordering[-1]
+        return (*ordering, '-id' if last.startswith('-') else 'id')
+
+
 class IngredientSearchFilter(filters.FilterSet):
     """Фильтр поиска по названию ингредиента."""
     name = filters.CharFilter(lookup_expr='istartswith')
@@ -0,0 +1,70 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_vary_headers
+from recipe.cache_versions import get_versions
+from rest_framework import status
+from rest_framework.response import Response
+
+
+class AnonymousCacheMixin:
+    """Кэширование ответов list/retrieve для анонимных пользователей.
+
+    Ключ строится из пути, нормализованных параметров запроса и текущих
+    значений счётчиков версий из get_cache_versions, поэтому для
+    инвалидации достаточно увеличить счётчик. Тот же ключ служит ETag.
+    """
+
+    cache_query_params = ()
+    multi_value_query_params = ()
+    cache_timeout = settings.RESPONSE_CACHE_TIMEOUT
+
+    def get_cache_versions(self):
+        raise NotImplementedError
+
+    def get_response_cache_key(self, request):
+        if not request.user.is_anonymous:
+            return None
+        params = []
+        for key, values in sorted(request.query_params.lists()):
+            if key not in self.cache_query_params:
+                return None
+            values = [value for value in values if value]
+            if key in self.multi_value_query_params:
+                values = sorted(set(values))
+            if values:
+                params.append((key, values))
+        source = repr((
+            request.path, params, get_versions(*self.get_cache_versions())
+        ))
+        return 'response:' + md5(source.encode()).hexdigest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return handler(request, *args, **kwargs)
+        etag = f'"{key[len("response:"):]}"'
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+        if etag in (tag.strip() for tag in if_none_match.split(',')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data, self.cache_timeout)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
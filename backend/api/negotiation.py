@@ -0,0 +1,13 @@
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+class IgnoreFormatContentNegotiation(DefaultContentNegotiation):
+    """Выбор рендерера без учёта параметра ?format=.
+
+    Нужен для действий, которые сами обрабатывают ?format=,
+    например для выгрузки списка покупок.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        renderer = renderers[0]
+        return renderer, renderer.media_type
@@ -1,5 +1,272 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+from collections import OrderedDict
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from recipe.cache_versions import get_versions
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по статистике планировщика PostgreSQL.
+
+    Для запроса без условий берётся reltuples таблицы, для остальных —
+    оценка строк из EXPLAIN. На других СУБД возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table]
+            )
+            return int(cursor.fetchone()[0])
+        sql, params = queryset.order_by().query.sql_with_params()
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+class CountingPaginator(Paginator):
+    """Paginator, не считающий большие выборки при каждом запросе.
+
+    Точное число кэшируется на короткое время по тексту запроса и
+    значениям счётчиков версий cache_versions, так что ключ учитывает
+    все фильтры и пользователя, а изменения данных его сбрасывают. Если
+    планировщик оценивает выборку не меньше чем в estimate_threshold
+    строк, используется эта оценка. Для числа из кэша или из оценки
+    count_exact становится False.
+    """
+
+    count_timeout = settings.PAGINATION_COUNT_TIMEOUT
+    estimate_threshold = settings.PAGINATION_ESTIMATE_THRESHOLD
+    count_exact = True
+
+    def __init__(self, *args, cache_versions=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_versions = cache_versions
+
+    def validate_number(self, number):
+        """Страница за пределами неточного count не ошибка: count мог
+        отстать от данных. За пределами точного count — 404, как у
+        Paginator."""
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if self.count_exact or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.object_list[bottom:bottom + self.per_page], number, self
+        )
+
+    def get_count_cache_key(self):
+        sql, params = self.object_list.query.sql_with_params()
+        source = repr((sql, params, get_versions(*self.cache_versions)))
+        return 'count:' + md5(source.encode()).hexdigest()
+
+    @cached_property
+    def count(self):
+        try:
+            key = self.get_count_cache_key()
+        except EmptyResultSet:
+            return 0
+        count = cache.get(key)
+        if count is not None:
+            self.count_exact = False
+            return count
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.estimate_threshold:
+            self.count_exact = False
+            return estimate
+        count = self.object_list.count()
+        cache.set(key, count, self.count_timeout)
+        return count
+
+
+class CountingPagination(CustomPagination):
+    """Нумерация страниц с кэшированным или оценочным числом объектов.
+
+    Счётчики версий для ключа кэша берутся из get_count_cache_versions
+    представления. Пока число неточное, ссылка next есть у каждой полной
+    страницы: новые объекты могли попасть за пределы count.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        count_cache_versions = getattr(
+            view, 'get_count_cache_versions', tuple
+        )
+        self.django_paginator_class = partial(
+            CountingPaginator, cache_versions=count_cache_versions()
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_next_link(self):
+        page = self.page
+        if (
+            page.has_next()
+            or page.paginator.count_exact
+            or len(page) < page.paginator.per_page
+        ):
+            return super().get_next_link()
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+            page.number + 1
+        )
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_exact', self.page.paginator.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class RecipeKeysetPagination(BasePagination):
+    """Постраничный вывод рецептов по ключу (pub_date, id).
+
+    Страница выбирается условием на ключ последней показанной записи,
+    поэтому без COUNT и OFFSET, и дальние страницы не дороже первой.
+    Курсор непрозрачен для клиента: ссылки next и previous берутся
+    из ответа.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Неверный курсор.'
+    conflicting_query_params = ('ordering', 'search')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.check_query_params(request)
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            lookup = 'lt' if reverse else 'gt'
+            # Условие pub_date >= X (<= X) отдельно от OR: по нему индекс
+            # (pub_date, id) читается с позиции курсора, а не с начала.
+            queryset = queryset.filter(
+                Q(**{f'pub_date__{lookup}e': pub_date}),
+                Q(**{f'pub_date__{lookup}': pub_date})
+                | Q(pub_date=pub_date, **{f'id__{lookup}': pk})
+            )
+        ordering = ('-pub_date', '-id') if reverse else ('pub_date', 'id')
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+        self.has_next = position is not None if reverse else has_more
+        self.has_previous = has_more if reverse else position is not None
+        self.page = results
+        return results
+
+    def check_query_params(self, request):
+        """Курсор задаёт свой порядок, поэтому сортировка и поиск с
+        ранжированием вместе с ним не поддерживаются."""
+        errors = {
+            param: f'Нельзя использовать вместе с {self.cursor_query_param}.'
+            for param in self.conflicting_query_params
+            if request.query_params.get(param, '').strip()
+        }
+        if errors:
+            raise ValidationError(errors)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        if page_size <= 0:
+            return api_settings.PAGE_SIZE
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            pub_date, pk, reverse = b64decode(
+                encoded.encode(), altchars=b'-_', validate=True
+            ).decode().split('|')
+            position = (parse_datetime(pub_date), int(pk))
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse == 'r'
+
+    def encode_cursor(self, recipe, reverse):
+        token = b64encode(
+            f'{recipe.pub_date.isoformat()}|{recipe.pk}|'
+            f'{"r" if reverse else "f"}'.encode(),
+            altchars=b'-_'
+        ).decode()
+        url = remove_query_param(self.request.build_absolute_uri(), 'page')
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class RecipePagination(CountingPagination):
+    """Номера страниц по умолчанию или курсор, если передан ?cursor=.
+
+    Первая страница в режиме курсора запрашивается с пустым ?cursor=.
+    """
+
+    def __init__(self):
+        self.keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_param = RecipeKeysetPagination.cursor_query_param
+        if cursor_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        self.keyset = RecipeKeysetPagination()
+        return self.keyset.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is None:
+            return super().get_paginated_response(data)
+        return self.keyset.get_paginated_response(data)
@@ -1,11 +1,21 @@
+from collections import Counter
+
+from django.db.models import Manager
 from django.db.transaction import atomic
-from drf_extra_fields.fields import Base64ImageField
+from drf_extra_fields.fields import HybridImageField
+from recipe.images import reset_variants, schedule_image_processing
 from recipe.models import (Favorite, Ingredients, Recipe, RecipesIngredients,
-                           ShoppingCart, Tag)
+                           ShoppingCart, ShoppingListItem, Tag)
+from recipe.tag_registry import attach_tag_ids, get_tag_registry
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 from users.models import Follow, User
 
+from .uploads import check_image_limits
+
+RECIPES_LIMIT_MAX = 50
+PANTRY_INGREDIENTS_MAX = 100
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор представления пользователя."""
@@ -28,6 +38,8 @@ class UserSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return request.user.follower.filter(author=obj).exists()
 
 
@@ -78,10 +90,12 @@ class RecipesIngredientsSeriliazers(serializers.ModelSerializer):
 
 
 class AddIngredientSerializer(serializers.ModelSerializer):
-    """ Сериализатор добавления ингредиентов. """
-    id = serializers.PrimaryKeyRelatedField(
-        source='ingredient', queryset=Ingredients.objects.all()
-    )
+    """ Сериализатор добавления ингредиентов.
+
+    Ингредиенты по id ищутся сразу для всего рецепта
+    в CreateUpdateRecipeSerialiazer.validate.
+    """
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipesIngredients
@@ -104,52 +118,119 @@ class AddIngredientSerializer(serializers.ModelSerializer):
         )
 
 
+class RecipeImageField(serializers.ImageField):
+    """Ссылка на готовый вариант изображения рецепта или на оригинал.
+
+    Вариант берётся из context['image_variant'], если он задан.
+    """
+
+    def __init__(self, variant, **kwargs):
+        self.variant = variant
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        variant = self.context.get('image_variant', self.variant)
+        image = getattr(recipe, f'image_{variant}') or recipe.image
+        return super().to_representation(image)
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов с тегами страницы, загруженными одним запросом.
+
+    Реестр тегов берётся один раз на список и передаётся рецептам через
+    context['tag_registry'].
+    """
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        attach_tag_ids(recipes)
+        self.context['tag_registry'] = get_tag_registry()
+        return super().to_representation(recipes)
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор рецепта GET."""
 
     author = UserSerializer(read_only=True)
-    tags = TagSerializer(read_only=True, many=True)
+    tags = serializers.SerializerMethodField()
     ingredients = serializers.SerializerMethodField(
         read_only=True
     )
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField(variant='card')
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients',
             'is_favorited', 'is_in_shopping_cart',
-            'name', 'image', 'text', 'cooking_time'
+            'name', 'image', 'text', 'cooking_time',
+            'favorites_count', 'carts_count',
         )
+        list_serializer_class = RecipeListSerializer
+
+    def get_tags(self, obj):
+        if not hasattr(obj, 'tag_ids'):
+            attach_tag_ids([obj])
+        registry = self.context.get('tag_registry') or get_tag_registry()
+        return registry.data(obj.tag_ids)
 
     @staticmethod
     def get_ingredients(obj):
-        ingredients = RecipesIngredients.objects.filter(formula=obj)
+        ingredients = obj.recipe_ingredients.all()
         return RecipesIngredientsSeriliazers(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return request.user.favorite_user.filter(recipe=obj).exists()
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
         if not request or request.user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return request.user.cart.filter(recipe=obj).exists()
 
 
+class RecipeMatchSerializer(RecipeReadSerializer):
+    """Рецепт из подбора по продуктам: доля имеющихся и недостающие."""
+
+    coverage = serializers.SerializerMethodField()
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + (
+            'coverage', 'missing_ingredients'
+        )
+
+    def get_coverage(self, obj):
+        matched, total = self.context['matches'][obj.id]
+        return round(matched / total, 2)
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context['pantry']
+        return IngredientsSerializer(
+            [
+                item.ingredient for item in obj.recipe_ingredients.all()
+                if item.ingredient_id not in pantry
+            ],
+            many=True
+        ).data
+
+
 class CreateUpdateRecipeSerialiazer(serializers.ModelSerializer):
     """Сериализатор рецетов."""
 
-    tags = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(), many=True
-    )
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = AddIngredientSerializer(many=True)
-    image = Base64ImageField(use_url=True, max_length=None)
+    image = HybridImageField(use_url=True, max_length=None)
     author = UserSerializer(read_only=True)
 
     class Meta:
@@ -168,17 +249,89 @@ class CreateUpdateRecipeSerialiazer(serializers.ModelSerializer):
             ) for ingredient in ingredients
         ])
 
+    @staticmethod
+    def update_ingredients(recipe, new_amounts):
+        """Приводит состав рецепта к new_amounts {ingredient_id: amount}.
+
+        Меняются только отличающиеся строки: одно обновление количеств,
+        одна вставка и одно удаление. Возвращает прежний состав.
+        """
+        stored = {
+            item.ingredient_id: item
+            for item in RecipesIngredients.objects.filter(formula=recipe)
+        }
+        changed = [
+            RecipesIngredients(id=item.id, amount=new_amounts[ingredient_id])
+            for ingredient_id, item in stored.items()
+            if new_amounts.get(ingredient_id, item.amount) != item.amount
+        ]
+        RecipesIngredients.objects.bulk_update(changed, ['amount'])
+        RecipesIngredients.objects.bulk_create([
+            RecipesIngredients(
+                formula=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in new_amounts.items()
+            if ingredient_id not in stored
+        ])
+        removed = [
+            item.id for ingredient_id, item in stored.items()
+            if ingredient_id not in new_amounts
+        ]
+        if removed:
+            RecipesIngredients.objects.filter(id__in=removed).delete()
+        return {
+            ingredient_id: item.amount
+            for ingredient_id, item in stored.items()
+        }
+
+    def validate_image(self, image):
+        check_image_limits(size=image.size, dimensions=image.image.size)
+        return image
+
+    @staticmethod
+    def resolve_ids(in_bulk, ids, name):
+        """Объекты по списку ids через функцию in_bulk и ошибки списка."""
+        objects = in_bulk(set(ids))
+        errors = []
+        duplicates = sorted(
+            object_id for object_id, count in Counter(ids).items()
+            if count > 1
+        )
+        if duplicates:
+            errors.append(
+                f'Есть повторяющиеся {name}: {", ".join(map(str, duplicates))}'
+            )
+        missing = sorted(set(ids) - objects.keys())
+        if missing:
+            errors.append(
+                f'Не найдены {name}: {", ".join(map(str, missing))}'
+            )
+        return objects, errors
+
     def validate(self, data):
-        ingredients = self.initial_data.get('ingredients')
-        ingredients_list = []
-        for ingredient in ingredients:
-            ingredient_id = ingredient['id']
-            if ingredient_id in ingredients_list:
-                raise serializers.ValidationError(
-                    'Есть повторяющиеся ингредиенты!'
-                )
-            ingredients_list.append(ingredient_id)
-        if data['cooking_time'] <= 0:
+        errors = {}
+        if 'ingredients' in data:
+            ingredients, errors['ingredients'] = self.resolve_ids(
+                Ingredients.objects.in_bulk,
+                [ingredient['id'] for ingredient in data['ingredients']],
+                'ингредиенты'
+            )
+            data['ingredients'] = [
+                {
+                    'ingredient': ingredients.get(ingredient['id']),
+                    'amount': ingredient['amount'],
+                }
+                for ingredient in data['ingredients']
+            ]
+        if 'tags' in data:
+            tags, errors['tags'] = self.resolve_ids(
+                get_tag_registry().in_bulk, data['tags'], 'теги'
+            )
+            data['tags'] = [tags.get(tag_id) for tag_id in data['tags']]
+        errors = {field: error for field, error in errors.items() if error}
+        if errors:
+            raise serializers.ValidationError(errors)
+        if 'cooking_time' in data and data['cooking_time'] <= 0:
             raise serializers.ValidationError(
                 'Время приготовления должно быть больше 0!'
             )
@@ -194,15 +347,27 @@ class CreateUpdateRecipeSerialiazer(serializers.ModelSerializer):
             **validated_data
         )
         self.create_ingredients(recipe, ingredients)
-        recipe.tags.set(tags)
+        recipe.tags.add(*tags)
+        schedule_image_processing(recipe)
         return recipe
 
     @atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
         recipe = instance
-        RecipesIngredients.objects.filter(formula=recipe).delete()
-        self.create_ingredients(recipe, ingredients)
+        if 'image' in validated_data:
+            reset_variants(recipe)
+            schedule_image_processing(recipe)
+        if 'ingredients' in validated_data:
+            new_amounts = {
+                ingredient['ingredient'].id: ingredient['amount']
+                for ingredient in validated_data.pop('ingredients')
+            }
+            old_amounts = self.update_ingredients(recipe, new_amounts)
+            ShoppingListItem.objects.change_recipe(
+                recipe, old_amounts, new_amounts
+            )
+        if 'tags' in validated_data:
+            recipe.tags.set(validated_data.pop('tags'))
         return super().update(recipe, validated_data)
 
     def to_representation(self, instance):
@@ -210,6 +375,7 @@ class CreateUpdateRecipeSerialiazer(serializers.ModelSerializer):
             instance,
             context={
                 'request': self.context.get('request'),
+                'image_variant': 'full',
             }
         ).data
 
@@ -218,6 +384,8 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
     """
     Сериализатор для краткого отображения сведений о рецепте
     """
+    image = RecipeImageField(variant='thumbnail')
+
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -265,23 +433,50 @@ class FollowSerializer(UserSerializer):
         )
 
     def get_recipes(self, author):
-        queryset = self.context.get('request')
-        recipes_limit = queryset.query_params.get('recipes_limit')
-        if not recipes_limit:
-            return ShortRecipeSerializer(
-                Recipe.objects.filter(author=author),
-                many=True, context={'request': queryset}
-            ).data
+        request = self.context.get('request')
+        recipes = getattr(author, 'recipes_preview', None)
+        if recipes is None:
+            limit_serializer = RecipesLimitSerializer(
+                data=request.query_params
+            )
+            limit_serializer.is_valid(raise_exception=True)
+            recipes = Recipe.objects.filter(author=author)[
+                :limit_serializer.validated_data['recipes_limit']
+            ]
         return ShortRecipeSerializer(
-            Recipe.objects.filter(author=author)[:int(recipes_limit)],
-            many=True,
-            context={'request': queryset}
+            recipes, many=True, context={'request': request}
         ).data
 
     def get_recipes_count(self, author):
+        if hasattr(author, 'recipes_count'):
+            return author.recipes_count
         return Recipe.objects.filter(author=author).count()
 
 
+class RecipesLimitSerializer(serializers.Serializer):
+    """Сериализатор параметра recipes_limit."""
+
+    recipes_limit = serializers.IntegerField(
+        min_value=0, required=False, default=RECIPES_LIMIT_MAX
+    )
+
+    def validate_recipes_limit(self, value):
+        return min(value, RECIPES_LIMIT_MAX)
+
+
+class PantrySerializer(serializers.Serializer):
+    """Параметры подбора рецептов по имеющимся ингредиентам."""
+
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=PANTRY_INGREDIENTS_MAX
+    )
+    min_coverage = serializers.FloatField(
+        min_value=0, max_value=1, required=False, default=0
+    )
+
+
 class FollowSubSerializer(serializers.ModelSerializer):
     """Сериализатор подписки и отписки."""
 
@@ -0,0 +1,1002 @@
+import csv
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from threading import Thread
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from foodgram.cache import LockingFileBasedCache
+from PIL import Image
+from recipe.ingredient_index import invalidate_ingredient_index
+from recipe.models import (Favorite, Ingredients, Recipe, RecipesIngredients,
+                           ShoppingCart, ShoppingListItem, Tag)
+from recipe.search import full_text_search_enabled
+from recipe.tag_registry import get_tag_registry
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.authentication import CachedTokenAuthentication
+from users.models import Follow
+
+from .exporters import PdfExporter
+from .filters import MAX_ID
+from .serializers import RECIPES_LIMIT_MAX
+from .views import INGREDIENT_SEARCH_LIMIT, RecipeViewSet
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+PNG_DATA_URI = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mP8z8DwHwAFBQIAX8jx0gAAAABJRU5ErkJggg=='
+)
+
+
+def reset_cache():
+    """Очищает кэш и счётчики версий и заново загружает реестр тегов,
+    чтобы его запрос не попадал в подсчёт."""
+    cache.clear()
+    caches['versions'].clear()
+    get_tag_registry()
+
+
+class RecipeTestData:
+    """Авторы, теги, ингредиенты и рецепты для тестов API."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f'user{number}@foodgram.ru',
+                username=f'user{number}',
+                first_name='Имя',
+                last_name='Фамилия',
+                password='Password12345'
+            )
+            for number in range(3)
+        ]
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag{number}',
+                color=f'#00000{number}'
+            )
+            for number in range(3)
+        ]
+        cls.ingredients = [
+            Ingredients.objects.create(
+                name=f'Ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(5)
+        ]
+        cls.recipes = []
+        for number in range(9):
+            recipe = Recipe.objects.create(
+                author=cls.users[number % 3],
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/media/recipe.png'
+            )
+            recipe.tags.set(cls.tags[:1 + number % 3])
+            RecipesIngredients.objects.bulk_create(
+                RecipesIngredients(
+                    formula=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in cls.ingredients[:1 + number % 5]
+            )
+            cls.recipes.append(recipe)
+        user = cls.users[0]
+        Follow.objects.create(author=cls.users[1], following=user)
+        Favorite.objects.create(user=user, recipe=cls.recipes[1])
+        ShoppingCart.objects.create(user=user, recipe=cls.recipes[2])
+        ShoppingListItem.objects.add_recipe(user, cls.recipes[2])
+        cls.token = Token.objects.create(user=user)
+
+    def setUp(self):
+        reset_cache()
+        self.guest_client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+
+class RecipeListQueriesTest(RecipeTestData, TestCase):
+    """Число запросов ленты рецептов не зависит от размера страницы."""
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        for client, queries in (
+            (self.guest_client, 4),
+            (self.authorized_client, 6),
+        ):
+            for limit in (2, 9):
+                with self.subTest(
+                    authorized=client is self.authorized_client, limit=limit
+                ):
+                    reset_cache()
+                    with self.assertNumQueries(queries):
+                        response = client.get(RECIPES_URL, {'limit': limit})
+                    self.assertEqual(
+                        len(response.json()['results']), limit
+                    )
+
+    def test_list_resolves_tag_registry_once(self):
+        with patch(
+            'api.serializers.get_tag_registry', wraps=get_tag_registry
+        ) as registry:
+            response = self.guest_client.get(RECIPES_URL, {'limit': 9})
+        self.assertEqual(len(response.json()['results']), 9)
+        registry.assert_called_once_with()
+
+    def test_retrieve_queries_do_not_depend_on_recipe_size(self):
+        for client in (self.guest_client, self.authorized_client):
+            with self.subTest(authorized=client is self.authorized_client):
+                counts = set()
+                for recipe in (self.recipes[0], self.recipes[4]):
+                    reset_cache()
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(f'{RECIPES_URL}{recipe.id}/')
+                    self.assertEqual(response.status_code, 200)
+                    counts.add(len(queries))
+                self.assertEqual(len(counts), 1)
+
+
+class RecipeUpdateTest(RecipeTestData, TestCase):
+    """Редактирование рецепта меняет только отличающиеся связи."""
+
+    WRITES = ('INSERT', 'UPDATE', 'DELETE')
+
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.recipes[3]
+        self.url = f'{RECIPES_URL}{self.recipe.id}/'
+        self.payload = {
+            'name': self.recipe.name,
+            'text': self.recipe.text,
+            'cooking_time': self.recipe.cooking_time,
+            'ingredients': [
+                {'id': item.ingredient_id, 'amount': item.amount}
+                for item in self.recipe.recipe_ingredients.all()
+            ],
+            'tags': list(self.recipe.tags.values_list('id', flat=True)),
+        }
+
+    def through_table_writes(self, queries):
+        tables = (
+            RecipesIngredients._meta.db_table,
+            Recipe.tags.through._meta.db_table,
+        )
+        return [
+            query['sql'] for query in queries
+            if query['sql'].lstrip().upper().startswith(self.WRITES)
+            and any(f'"{table}"' in query['sql'] for table in tables)
+        ]
+
+    def test_unchanged_recipe_does_not_write_through_tables(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.patch(
+                self.url, self.payload, format='json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.through_table_writes(queries), [])
+
+    def test_partial_update_keeps_omitted_relations(self):
+        for field in ('tags', 'ingredients'):
+            with self.subTest(omitted=field):
+                payload = {
+                    key: value for key, value in self.payload.items()
+                    if key != field
+                }
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.authorized_client.patch(
+                        self.url, payload, format='json'
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(self.through_table_writes(queries), [])
+                data = response.json()
+                self.assertEqual(
+                    [tag['id'] for tag in data['tags']],
+                    self.payload['tags']
+                )
+                self.assertEqual(
+                    [
+                        {'id': item['id'], 'amount': item['amount']}
+                        for item in data['ingredients']
+                    ],
+                    self.payload['ingredients']
+                )
+
+    def test_partial_update_of_name_only(self):
+        response = self.authorized_client.patch(
+            self.url, {'name': 'Новое название'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Новое название')
+        self.assertEqual(
+            self.recipe.cooking_time, self.payload['cooking_time']
+        )
+
+    def test_partial_update_rejects_zero_cooking_time(self):
+        response = self.authorized_client.patch(
+            self.url, {'cooking_time': 0}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeCountTest(RecipeTestData, TestCase):
+    """Закэшированное число рецептов сбрасывается при изменениях."""
+
+    def get_page(self, params):
+        response = self.authorized_client.get(RECIPES_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_new_recipe_resets_cached_count(self):
+        page = self.get_page({'limit': 9})
+        self.assertEqual((page['count'], page['count_exact']), (9, True))
+        self.assertIsNone(page['next'])
+        page = self.get_page({'limit': 9})
+        self.assertEqual((page['count'], page['count_exact']), (9, False))
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                author=self.users[1],
+                name='Новый рецепт',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/media/recipe.png'
+            )
+        page = self.get_page({'limit': 9})
+        self.assertEqual((page['count'], page['count_exact']), (10, True))
+        self.assertIsNotNone(page['next'])
+
+    def test_favorite_resets_cached_count(self):
+        params = {'is_favorited': 1}
+        self.assertEqual(self.get_page(params)['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.authorized_client.post(
+                f'{RECIPES_URL}{self.recipes[0].id}/favorite/'
+            )
+        self.assertEqual(self.get_page(params)['count'], 2)
+
+    def test_full_page_links_next_while_count_is_cached(self):
+        self.get_page({'limit': 9})
+        page = self.get_page({'limit': 9})
+        self.assertFalse(page['count_exact'])
+        self.assertIsNotNone(page['next'])
+        self.assertIsNone(self.get_page({'limit': 9, 'page': 2})['next'])
+
+    def test_page_past_exact_count_is_not_found(self):
+        response = self.authorized_client.get(
+            RECIPES_URL, {'limit': 9, 'page': 2}
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_past_cached_count_is_empty(self):
+        self.get_page({'limit': 9})
+        page = self.get_page({'limit': 9, 'page': 3})
+        self.assertFalse(page['count_exact'])
+        self.assertEqual(page['results'], [])
+        self.assertIsNone(page['next'])
+
+
+class RecipeKeysetPaginationTest(RecipeTestData, TestCase):
+    """Постраничный вывод ленты по курсору."""
+
+    def get(self, url, params=None):
+        response = self.guest_client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_follow_pub_date_and_id(self):
+        expected = list(Recipe.objects.order_by(
+            'pub_date', 'id'
+        ).values_list('id', flat=True))
+        page = self.get(RECIPES_URL, {'cursor': '', 'limit': 4})
+        self.assertIsNone(page['previous'])
+        ids = [recipe['id'] for recipe in page['results']]
+        while page['next']:
+            page = self.get(page['next'])
+            ids += [recipe['id'] for recipe in page['results']]
+        self.assertEqual(ids, expected)
+        page = self.get(page['previous'])
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], expected[4:8]
+        )
+
+    def test_cursor_query_has_leading_bound(self):
+        first = self.get(RECIPES_URL, {'cursor': '', 'limit': 4})
+        with CaptureQueriesContext(connection) as queries:
+            self.get(first['next'])
+        sql = next(
+            query['sql'] for query in queries
+            if f'FROM "{Recipe._meta.db_table}"' in query['sql']
+        )
+        self.assertRegex(sql, r'"pub_date" >= ')
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('recipe_pub_date_idx (pub_date>?)', plan)
+
+    def test_ordering_and_search_are_rejected(self):
+        for param, value in (('ordering', '-favorites_count'),
+                             ('search', 'Рецепт')):
+            with self.subTest(param=param):
+                response = self.guest_client.get(
+                    RECIPES_URL, {'cursor': '', param: value}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(param, response.json())
+        self.get(RECIPES_URL, {'cursor': '', 'search': ' '})
+
+
+class RecipeDeleteQueriesTest(RecipeTestData, TestCase):
+    """Удаление рецепта обновляет кэши и индексы один раз на рецепт."""
+
+    def delete_queries(self, recipe):
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.authorized_client.delete(
+                    f'{RECIPES_URL}{recipe.id}/'
+                )
+        self.assertEqual(response.status_code, 204)
+        return len(queries)
+
+    def test_queries_do_not_depend_on_ingredient_count(self):
+        small, large = self.recipes[0], self.recipes[3]
+        self.delete_queries(self.recipes[6])
+        self.assertLess(
+            small.recipe_ingredients.count(),
+            large.recipe_ingredients.count()
+        )
+        self.assertEqual(
+            self.delete_queries(small), self.delete_queries(large)
+        )
+
+
+class SubscriptionsTest(RecipeTestData, TestCase):
+    """Превью рецептов в подписках ограничено recipes_limit."""
+
+    URL = '/api/users/subscriptions/'
+
+    def get_subscriptions(self, params=None):
+        response = self.authorized_client.get(self.URL, params or {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_recipes_limit(self):
+        for limit, expected in (('0', 0), ('2', 2), ('', 3)):
+            with self.subTest(recipes_limit=limit):
+                params = {'recipes_limit': limit} if limit else {}
+                author, = self.get_subscriptions(params)
+                self.assertEqual(len(author['recipes']), expected)
+                self.assertEqual(author['recipes_count'], 3)
+
+    def test_recipes_limit_is_capped(self):
+        Recipe.objects.bulk_create(
+            Recipe(
+                author=self.users[1],
+                name=f'Рецепт автора {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipe/media/recipe.png'
+            )
+            for number in range(RECIPES_LIMIT_MAX)
+        )
+        author, = self.get_subscriptions({'recipes_limit': 1000})
+        self.assertEqual(len(author['recipes']), RECIPES_LIMIT_MAX)
+        self.assertEqual(author['recipes_count'], RECIPES_LIMIT_MAX + 3)
+
+    def test_negative_recipes_limit_is_rejected(self):
+        response = self.authorized_client.get(
+            self.URL, {'recipes_limit': -1}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_do_not_depend_on_subscriptions(self):
+        counts = []
+        for author in self.users[1:]:
+            Follow.objects.get_or_create(
+                author=author, following=self.users[0]
+            )
+            reset_cache()
+            with CaptureQueriesContext(connection) as queries:
+                self.get_subscriptions({'recipes_limit': 2})
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ShoppingListDownloadTest(RecipeTestData, TestCase):
+    """Выгрузка списка покупок в поддерживаемых форматах."""
+
+    URL = f'{RECIPES_URL}download_shopping_cart/'
+
+    def download(self, export_format=None):
+        params = {'format': export_format} if export_format else {}
+        response = self.authorized_client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(content.decode().splitlines(), [
+            'Список покупок:',
+            'Ингредиент 0: 3 г',
+            'Ингредиент 1: 3 г',
+            'Ингредиент 2: 3 г',
+        ])
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertIn('shopping-list.csv', response['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+        self.assertEqual(rows, [
+            ['Ингредиент', 'Количество', 'Единица измерения'],
+            ['Ингредиент 0', '3', 'г'],
+            ['Ингредиент 1', '3', 'г'],
+            ['Ингредиент 2', '3', 'г'],
+        ])
+
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        xref = int(content.rsplit(b'startxref\n', 1)[1].split()[0])
+        self.assertTrue(content[xref:].startswith(b'xref'))
+        self.assertLess(len(content), 50 * 1024)
+
+    def test_unknown_format(self):
+        response = self.authorized_client.get(self.URL, {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('format', response.json())
+
+    def test_pdf_lines_fit_page_width(self):
+        exporter = PdfExporter()
+        max_width = (
+            (exporter.page_width - 2 * exporter.margin)
+            * 1000 // exporter.font_size
+        )
+        line = ' '.join(['Ингредиент'] * 30 + ['Ж' * 200])
+        rows = exporter.wrap(line)
+        self.assertGreater(len(rows), 1)
+        self.assertEqual(
+            ''.join(rows).replace(' ', ''), line.replace(' ', '')
+        )
+        for row in rows:
+            self.assertLessEqual(exporter.text_width(row), max_width)
+
+
+class ShoppingListTotalsTest(RecipeTestData, TestCase):
+    """Итоги списка покупок совпадают с составом рецептов в корзине."""
+
+    def totals(self, user):
+        return dict(ShoppingListItem.objects.filter(user=user).values_list(
+            'ingredient_id', 'total'
+        ))
+
+    def expected_totals(self, user):
+        return dict(RecipesIngredients.objects.filter(
+            formula__cart_recipe__user=user
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total'))
+
+    def assert_totals(self, user):
+        self.assertEqual(self.totals(user), self.expected_totals(user))
+
+    def cart(self, method, recipe):
+        response = getattr(self.authorized_client, method)(
+            f'{RECIPES_URL}{recipe.id}/shopping_cart/'
+        )
+        self.assertIn(response.status_code, (201, 204))
+
+    def test_cart_add_and_remove(self):
+        user = self.users[0]
+        ingredient = self.ingredients[0]
+        self.assertEqual(self.totals(user)[ingredient.id], 3)
+        self.cart('post', self.recipes[5])
+        self.assertEqual(self.totals(user)[ingredient.id], 9)
+        self.cart('post', self.recipes[4])
+        self.assert_totals(user)
+        self.cart('delete', self.recipes[2])
+        self.assert_totals(user)
+        self.cart('delete', self.recipes[4])
+        self.cart('delete', self.recipes[5])
+        self.assertEqual(self.totals(user), {})
+
+    def test_recipe_edit_changes_every_cart(self):
+        recipe = self.recipes[3]
+        other = self.users[1]
+        self.cart('post', recipe)
+        ShoppingCart.objects.create(user=other, recipe=recipe)
+        ShoppingListItem.objects.add_recipe(other, recipe)
+        response = self.authorized_client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            {'cooking_time': recipe.cooking_time, 'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 10},
+                {'id': self.ingredients[4].id, 'amount': 2},
+            ]},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        for user in (self.users[0], other):
+            with self.subTest(user=user.username):
+                self.assert_totals(user)
+        self.assertEqual(self.totals(other), {
+            self.ingredients[0].id: 10, self.ingredients[4].id: 2
+        })
+        response = self.authorized_client.delete(f'{RECIPES_URL}{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.totals(other), {})
+        self.assert_totals(self.users[0])
+
+
+class IngredientSearchTest(TestCase):
+    """Автодополнение ингредиентов по индексу в памяти процесса."""
+
+    URL = '/api/ingredients/'
+
+    def setUp(self):
+        reset_cache()
+        self.client = APIClient()
+
+    def search(self, name):
+        response = self.client.get(self.URL, {'name': name})
+        self.assertEqual(response.status_code, 200)
+        return [item['name'] for item in response.json()]
+
+    def test_prefix_matches_go_before_word_matches(self):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=name, measurement_unit='г')
+            for name in (
+                'сыр моцарелла', 'Молоко', 'масло', 'мука', 'Моцарелла',
+                'сливки молочные'
+            )
+        )
+        invalidate_ingredient_index()
+        self.assertEqual(self.search('мо'), [
+            'Молоко', 'Моцарелла', 'сливки молочные', 'сыр моцарелла'
+        ])
+        self.assertEqual(self.search('МОЦ'), ['Моцарелла', 'сыр моцарелла'])
+        self.assertEqual(self.search('хлеб'), [])
+
+    def test_result_is_limited(self):
+        Ingredients.objects.bulk_create(
+            Ingredients(name=f'соль {number:02}', measurement_unit='г')
+            for number in range(INGREDIENT_SEARCH_LIMIT + 5)
+        )
+        invalidate_ingredient_index()
+        self.assertEqual(self.search('соль'), [
+            f'соль {number:02}' for number in range(INGREDIENT_SEARCH_LIMIT)
+        ])
+
+    def test_new_ingredient_is_found_after_commit(self):
+        self.assertEqual(self.search('шафран'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredients.objects.create(name='Шафран', measurement_unit='г')
+        self.assertEqual(self.search('шафран'), ['Шафран'])
+
+    def test_loaded_ingredients_are_found(self):
+        self.assertEqual(self.search('шафран'), [])
+        path = os.path.join(tempfile.mkdtemp(), 'ingredients.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('шафран,г\nшалфей,г\n')
+        call_command('load_ingredients', path, stdout=io.StringIO())
+        self.assertEqual(self.search('ша'), ['шалфей', 'шафран'])
+
+
+class RecipeFilterTest(RecipeTestData, TestCase):
+    """Фильтры ленты рецептов."""
+
+    def get_page(self, params):
+        response = self.guest_client.get(RECIPES_URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_author_filter(self):
+        authors = [self.users[0].id, self.users[2].id]
+        page = self.get_page({'author': authors, 'limit': 9})
+        self.assertEqual(page['count'], 6)
+        self.assertEqual(
+            {recipe['author']['id'] for recipe in page['results']},
+            set(authors)
+        )
+
+    def test_author_out_of_range(self):
+        for author in ('0', '-1', str(MAX_ID + 1), '9' * 20, 'abc'):
+            with self.subTest(author=author):
+                response = self.guest_client.get(
+                    RECIPES_URL, {'author': author}
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('author', response.json())
+        self.assertEqual(self.get_page({'author': MAX_ID})['count'], 0)
+
+    def test_tags_filter_does_not_duplicate_recipes(self):
+        slugs = [tag.slug for tag in self.tags]
+        for tags, expected in (
+            (slugs, 9), (slugs[1:], 6), (slugs[2:], 3), (['missing'], 0)
+        ):
+            with self.subTest(tags=tags):
+                page = self.get_page({'tags': tags, 'limit': 20})
+                ids = [recipe['id'] for recipe in page['results']]
+                self.assertEqual(page['count'], expected)
+                self.assertEqual(len(ids), expected)
+                self.assertEqual(len(set(ids)), expected)
+
+
+@skipIf(full_text_search_enabled(), 'проверяется запасной поиск без FTS')
+class RecipeSearchFallbackTest(RecipeTestData, TestCase):
+    """Поиск рецептов через icontains на СУБД без полнотекстового поиска."""
+
+    def search(self, **params):
+        response = self.guest_client.get(RECIPES_URL, {'limit': 20, **params})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['name'] for recipe in response.json()['results']]
+
+    def test_name_matches_go_first(self):
+        Recipe.objects.filter(pk=self.recipes[5].pk).update(
+            text='Почти как борщ'
+        )
+        Recipe.objects.filter(pk=self.recipes[0].pk).update(
+            name='борщ украинский'
+        )
+        self.assertEqual(
+            self.search(search='борщ'), ['борщ украинский', 'Рецепт 5']
+        )
+
+    def test_every_word_matches_name_text_or_ingredient(self):
+        self.assertEqual(self.search(search='Ингредиент 4'), ['Рецепт 4'])
+        self.assertEqual(self.search(search='Рецепт Ингредиент 9'), [])
+
+    def test_search_combines_with_filters(self):
+        self.assertEqual(
+            self.search(search='Ингредиент 2', author=self.users[2].id),
+            ['Рецепт 2', 'Рецепт 8']
+        )
+        self.assertEqual(len(self.search(search=' ')), len(self.recipes))
+
+
+class PantryTest(RecipeTestData, TestCase):
+    """Подбор рецептов по имеющимся ингредиентам."""
+
+    URL = f'{RECIPES_URL}by_ingredients/'
+
+    def get(self, params):
+        response = self.guest_client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def expected_coverage(self, pantry):
+        coverage = {}
+        for recipe in self.recipes:
+            ingredient_ids = {
+                item.ingredient_id for item in recipe.recipe_ingredients.all()
+            }
+            matched = len(ingredient_ids & pantry)
+            if matched:
+                coverage[recipe.id] = round(matched / len(ingredient_ids), 2)
+        return coverage
+
+    def test_pages_are_ordered_by_coverage(self):
+        pantry = {self.ingredients[0].id, self.ingredients[1].id}
+        expected = self.expected_coverage(pantry)
+        params = {'ingredients': sorted(pantry), 'limit': 4}
+        results = []
+        for page_number in (1, 2, 3):
+            page = self.get({**params, 'page': page_number})
+            self.assertEqual(page['count'], len(expected))
+            results += page['results']
+        self.assertIsNone(page['next'])
+        self.assertEqual(
+            {recipe['id']: recipe['coverage'] for recipe in results},
+            expected
+        )
+        self.assertEqual(len(results), len(expected))
+        coverage = [recipe['coverage'] for recipe in results]
+        self.assertEqual(coverage, sorted(coverage, reverse=True))
+        partial = next(
+            recipe for recipe in results if recipe['id'] == self.recipes[4].id
+        )
+        self.assertEqual(
+            [item['name'] for item in partial['missing_ingredients']],
+            ['Ингредиент 2', 'Ингредиент 3', 'Ингредиент 4']
+        )
+
+    def test_min_coverage(self):
+        pantry = {self.ingredients[0].id, self.ingredients[1].id}
+        page = self.get({
+            'ingredients': sorted(pantry), 'min_coverage': 0.6, 'limit': 20
+        })
+        expected = {
+            recipe_id for recipe_id, coverage in
+            self.expected_coverage(pantry).items() if coverage >= 0.6
+        }
+        self.assertEqual(page['count'], len(expected))
+        self.assertEqual(
+            {recipe['id'] for recipe in page['results']}, expected
+        )
+
+    def test_invalid_params(self):
+        for params in ({}, {'ingredients': 'a'}, {
+            'ingredients': self.ingredients[0].id, 'min_coverage': 2
+        }):
+            with self.subTest(params=params):
+                response = self.guest_client.get(self.URL, params)
+                self.assertEqual(response.status_code, 400)
+
+
+class PopularityCountersTest(RecipeTestData, TestCase):
+    """Счётчики избранного и корзин рецепта."""
+
+    def toggle(self, client, method, recipe, action='favorite'):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(
+                f'{RECIPES_URL}{recipe.id}/{action}/'
+            )
+        self.assertIn(response.status_code, (201, 204))
+
+    def counters(self, recipe):
+        recipe.refresh_from_db()
+        return recipe.favorites_count, recipe.carts_count
+
+    def test_increment_and_decrement(self):
+        recipe = self.recipes[3]
+        self.toggle(self.authorized_client, 'post', recipe)
+        self.toggle(self.authorized_client, 'post', recipe, 'shopping_cart')
+        self.assertEqual(self.counters(recipe), (1, 1))
+        self.toggle(self.authorized_client, 'delete', recipe)
+        self.toggle(self.authorized_client, 'delete', recipe, 'shopping_cart')
+        self.assertEqual(self.counters(recipe), (0, 0))
+
+    def test_counter_does_not_go_below_zero(self):
+        recipe = self.recipes[3]
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeViewSet.change_counter(recipe, 'favorites_count', -3)
+        self.assertEqual(self.counters(recipe), (0, 0))
+
+    def test_cached_list_reflects_new_favorites(self):
+        recipe = self.recipes[0]
+        ordering = {'ordering': '-favorites_count', 'limit': 9}
+        queries = (ordering, {**ordering, 'author': recipe.author_id})
+        for params in queries:
+            first = self.guest_client.get(
+                RECIPES_URL, params
+            ).json()['results'][0]
+            self.assertNotEqual(first['id'], recipe.id)
+        other_client = APIClient()
+        other_client.force_authenticate(self.users[1])
+        for client in (self.authorized_client, other_client):
+            self.toggle(client, 'post', recipe)
+        for params in queries:
+            with self.subTest(params=params):
+                first = self.guest_client.get(
+                    RECIPES_URL, params
+                ).json()['results'][0]
+                self.assertEqual(
+                    (first['id'], first['favorites_count']), (recipe.id, 2)
+                )
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeImageUploadTest(RecipeTestData, TestCase):
+    """Изображение рецепта в multipart/form-data проверяется по лимитам."""
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @staticmethod
+    def png_file(size=(8, 8)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return SimpleUploadedFile(
+            'recipe.png', buffer.getvalue(), content_type='image/png'
+        )
+
+    def create(self, image):
+        return self.authorized_client.post(RECIPES_URL, {
+            'name': 'Рецепт с картинкой',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'tags': [self.tags[0].id],
+            'ingredients[0]id': self.ingredients[0].id,
+            'ingredients[0]amount': 2,
+            'image': image,
+        }, format='multipart')
+
+    def test_valid_image(self):
+        response = self.create(self.png_file())
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_limits(self):
+        for limits, size in (
+            ({'RECIPE_IMAGE_MAX_DIMENSION': 100}, (200, 50)),
+            ({'RECIPE_IMAGE_MAX_SIZE': 10}, (8, 8)),
+        ):
+            with self.subTest(**limits), self.settings(**limits):
+                response = self.create(self.png_file(size))
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('image', response.json())
+        self.assertFalse(
+            Recipe.objects.filter(name='Рецепт с картинкой').exists()
+        )
+
+
+class RecipeValidationTest(RecipeTestData, TestCase):
+    """Ингредиенты и теги рецепта проверяются пачкой."""
+
+    def post(self, ingredient_ids, tag_ids):
+        reset_cache()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.post(RECIPES_URL, {
+                'name': 'Новый рецепт',
+                'text': 'Описание',
+                'cooking_time': 5,
+                'image': PNG_DATA_URI,
+                'tags': tag_ids,
+                'ingredients': [
+                    {'id': ingredient_id, 'amount': 1}
+                    for ingredient_id in ingredient_ids
+                ],
+            }, format='json')
+        return response, len(queries)
+
+    def test_errors_are_aggregated(self):
+        first, second = self.ingredients[0].id, self.ingredients[1].id
+        response, _ = self.post(
+            [first, first, second, second, 9998, 9999],
+            [self.tags[0].id, 999]
+        )
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertEqual(errors['ingredients'], [
+            f'Есть повторяющиеся ингредиенты: {first}, {second}',
+            'Не найдены ингредиенты: 9998, 9999',
+        ])
+        self.assertEqual(errors['tags'], ['Не найдены теги: 999'])
+
+    def test_queries_do_not_depend_on_ingredient_count(self):
+        small = self.post([self.ingredients[0].id, 9999], [999])
+        large = self.post(
+            [ingredient.id for ingredient in self.ingredients] + [9999],
+            [999]
+        )
+        self.assertEqual(small[0].status_code, 400)
+        self.assertEqual(large[0].status_code, 400)
+        self.assertEqual(small[1], large[1])
+        self.assertIn('ingredients', large[0].json())
+
+
+class PermissionsTest(RecipeTestData, TestCase):
+    """Права на изменение тегов и рецептов."""
+
+    TAGS_URL = '/api/tags/'
+
+    def setUp(self):
+        super().setUp()
+        admin = User.objects.create_superuser(
+            email='admin@foodgram.ru',
+            username='admin',
+            first_name='Имя',
+            last_name='Фамилия',
+            password='Password12345'
+        )
+        self.admin_client = APIClient()
+        self.admin_client.force_authenticate(admin)
+        self.tag_url = f'{self.TAGS_URL}{self.tags[0].id}/'
+        self.new_tag = {'name': 'Новый', 'slug': 'new', 'color': '#123456'}
+
+    def test_only_admin_writes_tags(self):
+        for client, status_code in (
+            (self.guest_client, 401), (self.authorized_client, 403)
+        ):
+            with self.subTest(status_code=status_code):
+                self.assertEqual(client.post(
+                    self.TAGS_URL, self.new_tag, format='json'
+                ).status_code, status_code)
+                self.assertEqual(client.patch(
+                    self.tag_url, {'name': 'Другой'}, format='json'
+                ).status_code, status_code)
+                self.assertEqual(
+                    client.delete(self.tag_url).status_code, status_code
+                )
+                self.assertEqual(client.get(self.tag_url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.admin_client.post(
+                self.TAGS_URL, self.new_tag, format='json'
+            )
+        self.assertEqual(response.status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.admin_client.delete(self.tag_url)
+        self.assertEqual(response.status_code, 204)
+        slugs = [tag['slug'] for tag in self.guest_client.get(
+            self.TAGS_URL
+        ).json()]
+        self.assertEqual(slugs, ['tag1', 'tag2', 'new'])
+
+    def test_only_author_writes_recipe(self):
+        url = f'{RECIPES_URL}{self.recipes[1].id}/'
+        self.assertEqual(self.authorized_client.patch(
+            url, {'name': 'Чужой рецепт'}, format='json'
+        ).status_code, 403)
+        self.assertEqual(self.authorized_client.delete(url).status_code, 403)
+        self.assertEqual(
+            self.authorized_client.delete(f'{RECIPES_URL}9999/').status_code,
+            404
+        )
+
+
+class TokenAuthenticationTest(RecipeTestData, TestCase):
+    """Отозванный токен перестаёт действовать сразу."""
+
+    URL = '/api/users/subscriptions/'
+    LOGOUT_URL = '/api/auth/token/logout/'
+
+    def test_token_cache_is_off_with_process_local_cache(self):
+        self.assertFalse(CachedTokenAuthentication.cache_enabled)
+
+    def test_deleted_token_is_rejected(self):
+        for cache_enabled in (False, True):
+            with self.subTest(cache_enabled=cache_enabled), patch.object(
+                CachedTokenAuthentication, 'cache_enabled', cache_enabled
+            ):
+                token = Token.objects.create(user=self.users[1])
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+                self.assertEqual(client.get(self.URL).status_code, 200)
+                with self.captureOnCommitCallbacks(execute=True):
+                    response = client.post(self.LOGOUT_URL)
+                self.assertEqual(response.status_code, 204)
+                self.assertEqual(client.get(self.URL).status_code, 401)
+
+
+class VersionStoreTest(TestCase):
+    """Счётчики версий общие для всех процессов."""
+
+    def test_registry_sees_invalidation_from_another_process(self):
+        reset_cache()
+        registry = get_tag_registry()
+        Tag.objects.bulk_create([
+            Tag(name='Новый тег', slug='new', color='#123456')
+        ])
+        self.assertIs(get_tag_registry(), registry)
+        subprocess.run(
+            [
+                sys.executable, 'manage.py', 'shell', '-c',
+                'from recipe.tag_registry import invalidate_tag_registry; '
+                'invalidate_tag_registry()'
+            ],
+            cwd=settings.BASE_DIR, check=True
+        )
+        self.assertIn('new', get_tag_registry().slug_ids)
+
+    def test_file_cache_incr_is_atomic(self):
+        cache = LockingFileBasedCache(tempfile.mkdtemp(), {})
+        cache.set('counter', 0, timeout=None)
+
+        def increment():
+            for _ in range(50):
+                cache.incr('counter')
+
+        threads = [Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(cache.get('counter'), 200)
@@ -0,0 +1,78 @@
+"""Приём изображений рецептов из multipart/form-data."""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+IMAGE_HEADER_LIMIT = 1024 * 1024
+
+
+def check_image_limits(size=None, dimensions=None):
+    """Проверяет размер файла и изображения по настройкам проекта."""
+    if size is not None and size > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ValidationError({'image': (
+            'Размер файла не должен превышать '
+            f'{settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ.'
+        )})
+    if dimensions is not None and (
+        max(dimensions) > settings.RECIPE_IMAGE_MAX_DIMENSION
+    ):
+        raise ValidationError({'image': (
+            'Ширина и высота изображения не должны превышать '
+            f'{settings.RECIPE_IMAGE_MAX_DIMENSION} пикселей.'
+        )})
+
+
+def read_image_dimensions(header):
+    """Размеры изображения по началу файла или None, если данных мало."""
+    try:
+        with Image.open(BytesIO(header)) as image:
+            return image.size
+    except Image.DecompressionBombError:
+        raise ValidationError({'image': 'Изображение слишком большое.'})
+    except OSError:
+        if len(header) >= IMAGE_HEADER_LIMIT:
+            raise ValidationError({
+                'image': 'Загрузите корректное изображение.'
+            })
+        return None
+
+
+class RecipeImageUploadHandler(TemporaryFileUploadHandler):
+    """Пишет файл во временный файл по частям и проверяет лимиты на лету.
+
+    Размер проверяется на каждом фрагменте, размеры изображения — как
+    только пришёл его заголовок, поэтому слишком большой файл
+    отклоняется до того, как тело запроса будет прочитано целиком.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.header = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        try:
+            self.check_chunk(raw_data)
+        except ValidationError:
+            self.file.close()
+            raise
+        return super().receive_data_chunk(raw_data, start)
+
+    def check_chunk(self, raw_data):
+        check_image_limits(size=self.received)
+        if self.header is None:
+            return
+        self.header += raw_data
+        dimensions = read_image_dimensions(self.header)
+        if dimensions is not None:
+            check_image_limits(dimensions=dimensions)
+            self.header = None
+
+
+def use_recipe_image_upload(request):
+    """Подключает RecipeImageUploadHandler к запросу Django."""
+    request.upload_handlers = [RecipeImageUploadHandler(request)]
@@ -1,33 +1,61 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Value, Window)
+from django.db.models.functions import Greatest, RowNumber
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django_filters.rest_framework import DjangoFilterBackend
+from recipe.cache_versions import (ALL_RECIPES_VERSION, COMMON_RECIPES_VERSION,
+                                   author_recipes_version, bump_versions,
+                                   recipe_version, recipe_versions,
+                                   user_version)
+from recipe.ingredient_index import get_ingredient_index
 from recipe.models import (Favorite, Ingredients, Recipe, RecipesIngredients,
-                           ShoppingCart, Tag)
+                           ShoppingCart, ShoppingListItem, Tag)
+from recipe.pantry_index import get_pantry_index
+from recipe.tag_registry import get_tag_registry
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import (IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from users.models import Follow
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import CustomPagination
+from .exporters import SHOPPING_LIST_EXPORTERS
+from .filters import IngredientSearchFilter, RecipeFilter, RecipeOrderingFilter
+from .mixins import AnonymousCacheMixin
+from .negotiation import IgnoreFormatContentNegotiation
+from .pagination import CountingPagination, CustomPagination, RecipePagination
 from .permissions import IsAdminOrReadOnly, IsAuthor
 from .serializers import (CreateUpdateRecipeSerialiazer, FavoriteSerializer,
                           FollowSerializer, FollowSubSerializer,
-                          IngredientsSerializer, RecipeReadSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+                          IngredientsSerializer, PantrySerializer,
+                          RecipeMatchSerializer, RecipeReadSerializer,
+                          RecipesLimitSerializer, ShoppingCartSerializer,
+                          TagSerializer)
+from .uploads import use_recipe_image_upload
 
 User = get_user_model()
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+INGREDIENT_SEARCH_LIMIT = 20
+OWNER_ACTIONS = ('update', 'partial_update', 'destroy')
+
 
 class UserViewSet(viewsets.GenericViewSet):
     """Вьюсет пользователя."""
 
     queryset = User.objects.all()
     serializer_class = FollowSerializer
-    pagination_class = CustomPagination
+    pagination_class = CountingPagination
+
+    def get_count_cache_versions(self):
+        return (user_version(self.request.user.id),)
 
     @action(
         methods=('GET', ),
@@ -36,8 +64,19 @@ class UserViewSet(viewsets.GenericViewSet):
         permission_classes=[IsAuthenticated, ]
     )
     def subscriptions(self, request):
+        limit_serializer = RecipesLimitSerializer(data=request.query_params)
+        limit_serializer.is_valid(raise_exception=True)
         subscriptions_list = self.paginate_queryset(
-            User.objects.filter(following__following=request.user)
+            User.objects.filter(
+                following__following=request.user
+            ).annotate(
+                recipes_count=Count('recipe', distinct=True),
+                is_subscribed=Value(True, output_field=BooleanField())
+            ).order_by('id')
+        )
+        self.add_recipes_preview(
+            subscriptions_list,
+            limit_serializer.validated_data['recipes_limit']
         )
         serializer = FollowSerializer(
             subscriptions_list, many=True, context={
@@ -46,6 +85,35 @@ class UserViewSet(viewsets.GenericViewSet):
         )
         return self.get_paginated_response(serializer.data)
 
+    @staticmethod
+    def add_recipes_preview(authors, recipes_limit):
+        """Первые recipes_limit рецептов каждого автора одним запросом."""
+        previews = {author.id: [] for author in authors}
+        if previews and recipes_limit:
+            ranked = Recipe.objects.filter(
+                author__in=previews
+            ).only(
+                'id', 'author', 'name', 'image', 'image_thumbnail',
+                'cooking_time'
+            ).annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author')],
+                    order_by=[F('pub_date').asc(), F('id').asc()]
+                )
+            ).order_by()
+            sql, params = ranked.query.sql_with_params()
+            recipes = Recipe.objects.raw(
+                f'SELECT * FROM ({sql}) AS ranked '
+                f'WHERE ranked.recipe_rank <= %s '
+                f'ORDER BY ranked.author_id, ranked.recipe_rank',
+                (*params, recipes_limit)
+            )
+            for recipe in recipes:
+                previews[recipe.author_id].append(recipe)
+        for author in authors:
+            author.recipes_preview = previews[author.id]
+
     @action(
         methods=('POST', 'DELETE', ),
         detail=True,
@@ -81,6 +149,29 @@ class TagViewSet(viewsets.ModelViewSet):
     permission_classes = (IsAdminOrReadOnly,)
     pagination_class = None
 
+    @staticmethod
+    def registry_response(request, registry, data):
+        """Ответ из реестра тегов с ETag; при совпадении If-None-Match 304."""
+        response = Response(data)
+        response['ETag'] = registry.etag
+        patch_cache_control(response, no_cache=True)
+        return get_conditional_response(
+            request, etag=registry.etag, response=response
+        )
+
+    def list(self, request, *args, **kwargs):
+        registry = get_tag_registry()
+        return self.registry_response(request, registry, registry.data())
+
+    def retrieve(self, request, *args, **kwargs):
+        registry = get_tag_registry()
+        pk = str(kwargs['pk'])
+        if not pk.isdigit() or int(pk) not in registry.items:
+            raise Http404
+        return self.registry_response(
+            request, registry, registry.data([int(pk)])[0]
+        )
+
 
 class IngredientsViewSet(viewsets.ModelViewSet):
     """Вьюсет ингредиентов."""
@@ -91,21 +182,173 @@ class IngredientsViewSet(viewsets.ModelViewSet):
     filterset_class = IngredientSearchFilter
     search_fields = ('^name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return Response(
+            get_ingredient_index().search(name, INGREDIENT_SEARCH_LIMIT)
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
     """Вьюсет рецептов."""
 
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly, IsAuthor, )
     filterset_class = RecipeFilter
-    pagination_class = CustomPagination
-    ordering_fields = ('pub_date',)
+    pagination_class = RecipePagination
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
+    ordering_fields = ('pub_date', 'favorites_count', 'carts_count')
+    cache_query_params = (
+        'page', 'limit', 'tags', 'author', 'search', 'ordering'
+    )
+    multi_value_query_params = ('tags', 'author')
+
+    def get_cache_versions(self):
+        if self.action == 'retrieve':
+            return (COMMON_RECIPES_VERSION, recipe_version(self.kwargs['pk']))
+        authors = self.request.query_params.getlist('author')
+        if authors and all(author.isdigit() for author in authors):
+            return (COMMON_RECIPES_VERSION, *(
+                author_recipes_version(author)
+                for author in sorted({int(author) for author in authors})
+            ))
+        return (COMMON_RECIPES_VERSION, ALL_RECIPES_VERSION)
+
+    def get_count_cache_versions(self):
+        """Версии для кэша числа рецептов: фильтры избранного и корзины
+        зависят ещё и от пользователя."""
+        versions = self.get_cache_versions()
+        if self.request.user.is_anonymous:
+            return versions
+        return (*versions, user_version(self.request.user.id))
+
+    def get_queryset(self):
+        if self.action in OWNER_ACTIONS:
+            return Recipe.objects.filter(author_id=self.request.user.id)
+        if self.action not in ['list', 'retrieve', 'by_ingredients']:
+            return Recipe.objects.all()
+        user = self.request.user
+        queryset = Recipe.objects.prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipesIngredients.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+        if user.is_anonymous:
+            return queryset.select_related('author')
+        authors = User.objects.annotate(
+            is_subscribed=Exists(
+                Follow.objects.filter(
+                    author=OuterRef('pk'), following=user
+                )
+            )
+        )
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors)
+        ).annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(recipe=OuterRef('pk'), user=user)
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(recipe=OuterRef('pk'), user=user)
+            )
+        )
+
+    def get_object(self):
+        """Рецепт автора одним запросом; чужой рецепт — 403, а не 404."""
+        try:
+            return super().get_object()
+        except Http404:
+            pk = str(self.kwargs['pk'])
+            if self.action in OWNER_ACTIONS and pk.isdigit() and (
+                Recipe.objects.filter(pk=pk).exists()
+            ):
+                self.permission_denied(self.request)
+            raise
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListItem.objects.change_recipe(
+            instance, ShoppingListItem.objects.recipe_amounts(instance), {}
+        )
+        instance.delete()
+
+    def initialize_request(self, request, *args, **kwargs):
+        action = self.action_map.get(request.method.lower())
+        if action in ('create', 'update', 'partial_update'):
+            use_recipe_image_upload(request)
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['image_variant'] = 'full'
+        return context
 
     def get_serializer_class(self):
         if self.action in ['list', 'retrieve']:
             return RecipeReadSerializer
         return CreateUpdateRecipeSerialiazer
 
+    @staticmethod
+    def change_counter(recipe, field, delta):
+        """Атомарно меняет счётчик рецепта на delta, не опуская ниже 0.
+
+        Счётчики видны и в ленте, и в её порядке (?ordering=), поэтому
+        после коммита сбрасываются кэши и рецепта, и списков.
+        """
+        if not delta:
+            return
+        Recipe.objects.filter(pk=recipe.pk).update(
+            **{field: Greatest(F(field) + delta, 0)}
+        )
+        transaction.on_commit(partial(
+            bump_versions, *recipe_versions(recipe.pk, recipe.author_id)
+        ))
+
+    @action(
+        methods=('GET', ),
+        detail=False,
+        url_path='by_ingredients',
+        pagination_class=CustomPagination
+    )
+    def by_ingredients(self, request):
+        """Рецепты по имеющимся ингредиентам, ?ingredients=1&ingredients=7.
+
+        Порядок — по доле ингредиентов рецепта, которые уже есть; его
+        считает обратный индекс в памяти, из базы читается только
+        выбранная страница.
+        """
+        params = PantrySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        pantry = set(params.validated_data['ingredients'])
+        page = self.paginate_queryset(get_pantry_index().match(
+            pantry, params.validated_data['min_coverage']
+        ))
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        serializer = RecipeMatchSerializer(
+            [
+                recipes[recipe_id] for recipe_id, _, _ in page
+                if recipe_id in recipes
+            ],
+            many=True,
+            context={
+                **self.get_serializer_context(),
+                'pantry': pantry,
+                'matches': {
+                    recipe_id: (matched, total)
+                    for recipe_id, matched, total in page
+                },
+            }
+        )
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=('POST', 'DELETE'),
         url_path='favorite',
@@ -125,14 +368,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                self.change_counter(recipe, 'favorites_count', 1)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         favorite = get_object_or_404(
             Favorite,
             user=user,
             recipe=recipe
         )
-        favorite.delete()
+        with transaction.atomic():
+            deleted, _ = favorite.delete()
+            self.change_counter(recipe, 'favorites_count', -deleted)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -154,38 +401,50 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 context={'request': request}
             )
             serializer.is_valid(raise_exception=True)
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
+                ShoppingListItem.objects.add_recipe(user, recipe)
+                self.change_counter(recipe, 'carts_count', 1)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         cart = get_object_or_404(
             ShoppingCart,
             user=user,
             recipe=recipe
         )
-        cart.delete()
+        with transaction.atomic():
+            deleted, _ = cart.delete()
+            ShoppingListItem.objects.remove_recipe(user, recipe)
+            self.change_counter(recipe, 'carts_count', -deleted)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
         detail=False,
         methods=['GET'],
         url_path='download_shopping_cart',
-        permission_classes=[IsAuthenticated]
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=IgnoreFormatContentNegotiation
     )
     def download_shopping_cart(self, request):
-        shopping_cart = RecipesIngredients.objects.filter(
-            formula__cart_recipe__user=request.user
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in SHOPPING_LIST_EXPORTERS:
+            raise ValidationError({
+                'format': 'Доступные форматы: {}'.format(
+                    ', '.join(SHOPPING_LIST_EXPORTERS)
+                )
+            })
+        exporter = SHOPPING_LIST_EXPORTERS[export_format]()
+        shopping_cart = ShoppingListItem.objects.filter(
+            user=request.user
         ).values_list(
-            'ingredient__name', 'ingredient__measurement_unit'
+            'ingredient__name', 'ingredient__measurement_unit', 'total'
         ).order_by(
             'ingredient__name'
-        ).annotate(
-            ingredient_total=Sum('amount')
-        )
-        text = 'Cписок покупок: \n'
-        for ingredients in shopping_cart:
-            name, measurement_unit, amount = ingredients
-            text += f'{name}: {amount} {measurement_unit}\n'
-        response = HttpResponse(text, content_type='text/plain')
-        filename = 'shop-list.pdf'
+        ).iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            exporter.stream(shopping_cart),
+            content_type=exporter.content_type
+        )
+        filename = f'shopping-list.{exporter.extension}'
         response['Content-Disposition'] = (
             f'attachment; filename={filename}'
         )
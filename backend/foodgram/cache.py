@@ -0,0 +1,32 @@
+"""Файловый кэш для счётчиков версий."""
+import os
+from contextlib import contextmanager
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files import locks
+
+
+class LockingFileBasedCache(FileBasedCache):
+    """Файловый кэш с атомарными для всех процессов машины add и incr.
+
+    FileBasedCache выполняет их чтением и последующей записью, и два
+    процесса могли бы получить одно и то же значение счётчика.
+    """
+
+    @contextmanager
+    def lock(self):
+        self._createdir()
+        with open(os.path.join(self._dir, 'lock'), 'ab') as lock_file:
+            locks.lock(lock_file, locks.LOCK_EX)
+            try:
+                yield
+            finally:
+                locks.unlock(lock_file)
+
+    def add(self, *args, **kwargs):
+        with self.lock():
+            return super().add(*args, **kwargs)
+
+    def incr(self, *args, **kwargs):
+        with self.lock():
+            return super().incr(*args, **kwargs)
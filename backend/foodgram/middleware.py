@@ -0,0 +1,142 @@
+"""Профилирование SQL-запросов для каждого запроса к API."""
+import json
+import logging
+import re
+from collections import Counter
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger('foodgram.queries')
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+SPACES = re.compile(r'\s+')
+DUPLICATES_IN_LOG = 5
+
+_profile = ContextVar('query_profile', default=None)
+
+
+def fingerprint(sql):
+    """Текст запроса без различий в длине списков IN и пробелах."""
+    return SPACES.sub(' ', IN_LIST.sub('IN (...)', sql)).strip()
+
+
+class RequestProfile:
+    """Запросы и время одного HTTP-запроса; подключается execute_wrapper."""
+
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries[fingerprint(sql)] += 1
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        return {
+            sql: count
+            for sql, count in self.queries.most_common(DUPLICATES_IN_LOG)
+            if count > 1
+        }
+
+
+def timed_serializer_data(get_data):
+    """Учитывает время внешнего вызова serializer.data в профиле запроса.
+
+    Вложенные сериализаторы не считаются повторно. Запросы, выполненные
+    при сериализации, входят и во время сериализатора, и во время БД.
+    """
+
+    def data(serializer):
+        profile = _profile.get()
+        if profile is None or profile.serializer_depth:
+            return get_data(serializer)
+        profile.serializer_depth += 1
+        started = perf_counter()
+        try:
+            return get_data(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            profile.serializer_time += perf_counter() - started
+
+    data.timed = True
+    return data
+
+
+def install_serializer_timer():
+    if not getattr(BaseSerializer.data.fget, 'timed', False):
+        BaseSerializer.data = property(
+            timed_serializer_data(BaseSerializer.data.fget)
+        )
+
+
+class QueryProfilingMiddleware:
+    """Считает SQL-запросы, время БД и сериализации для каждого запроса.
+
+    Итоги отдаются в заголовках Server-Timing и X-Query-Count и пишутся
+    одной JSON-строкой в журнал foodgram.queries. Запросы сверх
+    QUERY_PROFILING_BUDGET пишутся с уровнем WARNING. Сводку по журналу
+    строит команда query_report.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budget = settings.QUERY_PROFILING_BUDGET
+        install_serializer_timer()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _profile.set(profile)
+        started = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            _profile.reset(token)
+        self.report(request, response, profile, perf_counter() - started)
+        return response
+
+    def report(self, request, response, profile, total_time):
+        count = profile.query_count
+        over_budget = count > self.budget
+        db_ms = profile.db_time * 1000
+        serializer_ms = profile.serializer_time * 1000
+        total_ms = total_time * 1000
+        response['X-Query-Count'] = str(count)
+        response['Server-Timing'] = (
+            f'db;dur={db_ms:.1f};desc="{count} queries", '
+            f'serializer;dur={serializer_ms:.1f}, '
+            f'total;dur={total_ms:.1f}'
+        )
+        match = request.resolver_match
+        logger.log(
+            logging.WARNING if over_budget else logging.INFO,
+            json.dumps({
+                'endpoint': f'{request.method} '
+                + (match.view_name if match else request.path),
+                'path': request.path,
+                'status': response.status_code,
+                'queries': count,
+                'db_ms': round(db_ms, 2),
+                'serializer_ms': round(serializer_ms, 2),
+                'total_ms': round(total_ms, 2),
+                'over_budget': over_budget,
+                'duplicates': profile.duplicates(),
+            }, ensure_ascii=False)
+        )
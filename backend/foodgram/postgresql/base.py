@@ -0,0 +1,96 @@
+"""PostgreSQL с проверкой постоянных соединений и пулом."""
+import threading
+from functools import partial
+
+from django.db.backends.postgresql import base
+
+from .pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, settings_dict):
+    """Общий для всех потоков процесса пул или None, если он выключен."""
+    options = settings_dict.get('POOL') or {}
+    if not options.get('SIZE'):
+        return None
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                options['SIZE'],
+                options.get('TIMEOUT', 10),
+                options.get('STALE_AFTER', 30),
+            )
+        return _pools[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Стандартный бэкенд PostgreSQL с двумя дополнениями.
+
+    CONN_HEALTH_CHECKS: постоянное соединение (CONN_MAX_AGE > 0)
+    проверяется перед первым использованием в каждом запросе, и вместо
+    ошибки на упавшем соединении открывается новое. В Django 3.2
+    настройки ещё нет, проверка повторяет поведение Django 4.1.
+
+    POOL.SIZE > 0: соединения берутся из пула процесса, а закрытие
+    возвращает их туда. Пул нужен при потоковых воркерах gunicorn,
+    CONN_MAX_AGE при этом равен 0.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_enabled = self.settings_dict.get(
+            'CONN_HEALTH_CHECKS', False
+        )
+        self.health_check_done = False
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if (
+            self.connection is not None
+            and self.health_check_enabled
+            and not self.health_check_done
+            and not self.in_atomic_block
+        ):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        connection = pool.checkout(
+            partial(super().get_new_connection, conn_params)
+        )
+        # Соединение из пула прошло reset(), уровень изоляции сброшен.
+        isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level'
+        )
+        if isolation_level is None:
+            self.isolation_level = connection.isolation_level
+        elif isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=isolation_level)
+            self.isolation_level = isolation_level
+        return connection
+
+    def _close(self):
+        pool = self.pool
+        if pool is None:
+            super()._close()
+        elif self.connection is not None:
+            with self.wrap_database_errors:
+                pool.release(self.connection)
@@ -0,0 +1,106 @@
+"""Пул соединений psycopg2 для потоков одного процесса."""
+import threading
+from collections import deque
+from time import monotonic
+
+import psycopg2
+from django.db import OperationalError
+
+
+class PoolTimeout(OperationalError):
+    """Свободное соединение не появилось за время ожидания."""
+
+
+class ConnectionPool:
+    """Ограниченный пул соединений.
+
+    Открыто не больше size соединений; поток, которому соединения не
+    хватило, ждёт до timeout секунд. Соединение, пролежавшее в пуле
+    дольше stale_after секунд, перед выдачей проверяется запросом
+    SELECT 1, мёртвое закрывается и заменяется новым.
+    """
+
+    def __init__(self, size, timeout, stale_after):
+        self.size = size
+        self.timeout = timeout
+        self.stale_after = stale_after
+        self.idle = deque()
+        self.opened = 0
+        self.condition = threading.Condition()
+
+    def checkout(self, connect):
+        deadline = monotonic() + self.timeout
+        while True:
+            connection, released_at = self.reserve(deadline)
+            if connection is None:
+                try:
+                    return connect()
+                except Exception:
+                    self.forget()
+                    raise
+            if (
+                monotonic() - released_at < self.stale_after
+                or self.is_alive(connection)
+            ):
+                return connection
+            self.discard(connection)
+
+    def reserve(self, deadline):
+        """Свободное соединение из пула или место под новое."""
+        with self.condition:
+            while not self.idle and self.opened >= self.size:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f'Нет свободных соединений с БД: открыто '
+                        f'{self.opened} из {self.size}, ожидание '
+                        f'{self.timeout} с.'
+                    )
+                self.condition.wait(remaining)
+            if self.idle:
+                return self.idle.pop()
+            self.opened += 1
+            return None, None
+
+    def release(self, connection):
+        """Возвращает соединение в пул, сбросив транзакцию и сессию."""
+        if connection.closed:
+            self.forget()
+            return
+        try:
+            connection.reset()
+        except psycopg2.Error:
+            self.discard(connection)
+            return
+        with self.condition:
+            self.idle.append((connection, monotonic()))
+            self.condition.notify()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        self.forget()
+
+    def forget(self):
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_idle(self):
+        with self.condition:
+            idle = list(self.idle)
+            self.idle.clear()
+        for connection, _ in idle:
+            self.discard(connection)
+
+    @staticmethod
+    def is_alive(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
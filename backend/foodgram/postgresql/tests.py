@@ -0,0 +1,81 @@
+from threading import Timer
+
+import psycopg2
+from django.test import SimpleTestCase
+
+from .pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, sql):
+        pass
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера: только то, что нужно пулу."""
+
+    def __init__(self):
+        self.alive = True
+        self.closed = 0
+
+    def cursor(self):
+        if not self.alive:
+            raise psycopg2.OperationalError('server closed the connection')
+        return FakeCursor()
+
+    def rollback(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Выдача, возврат и проверка соединений пула."""
+
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def test_released_connection_is_reused(self):
+        pool = ConnectionPool(size=2, timeout=1, stale_after=30)
+        connection = pool.checkout(self.connect)
+        pool.release(connection)
+        self.assertIs(pool.checkout(self.connect), connection)
+        self.assertEqual(len(self.connections), 1)
+
+    def test_checkout_waits_for_release(self):
+        pool = ConnectionPool(size=1, timeout=5, stale_after=30)
+        connection = pool.checkout(self.connect)
+        Timer(0.05, pool.release, (connection,)).start()
+        self.assertIs(pool.checkout(self.connect), connection)
+
+    def test_checkout_times_out(self):
+        pool = ConnectionPool(size=1, timeout=0.05, stale_after=30)
+        pool.checkout(self.connect)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(self.connect)
+
+    def test_dead_idle_connection_is_replaced(self):
+        pool = ConnectionPool(size=1, timeout=1, stale_after=0)
+        connection = pool.checkout(self.connect)
+        pool.release(connection)
+        connection.alive = False
+        replacement = pool.checkout(self.connect)
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.opened, 1)
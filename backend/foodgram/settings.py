@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -63,6 +64,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+QUERY_PROFILING = os.getenv('QUERY_PROFILING', default='false') == 'true'
+QUERY_PROFILING_BUDGET = int(os.getenv('QUERY_PROFILING_BUDGET', default=20))
+QUERY_PROFILING_LOG = os.getenv(
+    'QUERY_PROFILING_LOG', default=os.path.join(BASE_DIR, 'queries.log')
+)
+if QUERY_PROFILING:
+    MIDDLEWARE.insert(0, 'foodgram.middleware.QueryProfilingMiddleware')
+
 CORS_ORIGIN_ALLOW_ALL = False
 CORS_URLS_REGEX = r'^/api/.*$'
 
@@ -97,10 +106,12 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 #    }
 # }
 
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+
 DATABASES = {
     'default': {
         'ENGINE': os.getenv('DB_ENGINE',
-                            default='django.db.backends.postgresql'),
+                            default='foodgram.postgresql'),
         'NAME': os.getenv('DB_NAME',
                           default='foodgram-project-react'),
         'USER': os.getenv('POSTGRES_USER',
@@ -110,10 +121,77 @@ DATABASES = {
         'HOST': os.getenv('DB_HOST',
                           default='db'),
         'PORT': os.getenv('DB_PORT',
-                          default='5432')
+                          default='5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL_SIZE else int(
+            os.getenv('DB_CONN_MAX_AGE', default=60)
+        ),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='true'
+        ) == 'true',
+        'POOL': {
+            'SIZE': DB_POOL_SIZE,
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'STALE_AFTER': float(
+                os.getenv('DB_POOL_STALE_AFTER', default=30)
+            ),
+        },
     }
 }
 
+# Бэкенды кэша, которые не видны другим процессам.
+PROCESS_LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+FILE_CACHE_BACKEND = 'foodgram.cache.LockingFileBasedCache'
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+    }
+}
+
+# Счётчики версий (recipe.cache_versions) сообщают всем процессам, что
+# закэшированные ответы, реестр тегов или индекс ингредиентов устарели,
+# поэтому хранилище счётчиков обязано быть общим для всех воркеров и
+# management-команд. Если основной кэш виден только своему процессу,
+# счётчики хранятся в файловом кэше: он общий для процессов одной
+# машины. При нескольких машинах задайте в CACHE_BACKEND (или
+# VERSION_CACHE_BACKEND) Redis или Memcached.
+if CACHES['default']['BACKEND'] in PROCESS_LOCAL_CACHE_BACKENDS:
+    VERSION_CACHE_DEFAULTS = (
+        FILE_CACHE_BACKEND,
+        os.path.join(tempfile.gettempdir(), 'foodgram-versions'),
+    )
+else:
+    VERSION_CACHE_DEFAULTS = (
+        CACHES['default']['BACKEND'], CACHES['default']['LOCATION']
+    )
+CACHES['versions'] = {
+    'BACKEND': os.getenv(
+        'VERSION_CACHE_BACKEND', default=VERSION_CACHE_DEFAULTS[0]
+    ),
+    'LOCATION': os.getenv(
+        'VERSION_CACHE_LOCATION', default=VERSION_CACHE_DEFAULTS[1]
+    ),
+    'OPTIONS': {'MAX_ENTRIES': 10000},
+}
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300))
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=300)
+)
+PAGINATION_COUNT_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_TIMEOUT', default=60)
+)
+PAGINATION_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_THRESHOLD', default=100000)
+)
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Password validation
@@ -160,12 +238,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_FORMAT = os.getenv('RECIPE_IMAGE_FORMAT', default='WEBP')
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=20 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_DIMENSION = int(
+    os.getenv('RECIPE_IMAGE_MAX_DIMENSION', default=8000)
+)
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
@@ -187,3 +281,29 @@ DJOSER = {
         'user_list': ['rest_framework.permissions.IsAuthenticatedOrReadOnly'],
     },
 }
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'queries': {
+            'format': '{asctime} {levelname} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'queries': {
+            'class': 'logging.FileHandler',
+            'filename': QUERY_PROFILING_LOG,
+            'formatter': 'queries',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'foodgram.queries': {
+            'handlers': ['queries'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
 
-from .models import (Favorite, Ingredients, Recipe, RecipesIngredients,
-                     ShoppingCart, Tag)
+from .models import (Favorite, Ingredients, Recipe, RecipeImageTask,
+                     RecipesIngredients, ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientInRecipeInline(admin.TabularInline):
@@ -49,8 +49,19 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe',)
 
 
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'total',)
+
+
+class RecipeImageTaskAdmin(admin.ModelAdmin):
+    list_display = ('recipe', 'status', 'attempts', 'updated',)
+    list_filter = ('status',)
+
+
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(ShoppingListItem, ShoppingListItemAdmin)
 admin.site.register(Recipe, RecipeAdmin)
+admin.site.register(RecipeImageTask, RecipeImageTaskAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredients, IngredientsAdmin)
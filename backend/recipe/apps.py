@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .search import create_search_index
+        post_migrate.connect(create_search_index, sender=self)
@@ -0,0 +1,57 @@
+"""Счётчики версий для инвалидации кэшей без перебора ключей.
+
+Счётчики лежат в кэше versions, общем для всех процессов (см.
+CACHES в settings): изменение, сделанное в одном воркере или в
+management-команде, видят все остальные.
+"""
+import time
+
+from django.core.cache import caches
+
+PREFIX = 'version:'
+COMMON_RECIPES_VERSION = 'recipes:common'
+ALL_RECIPES_VERSION = 'recipes'
+
+
+def get_versions(*names):
+    """Текущие значения счётчиков; отсутствующие создаются заново."""
+    cache = caches['versions']
+    keys = [PREFIX + name for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    cache = caches['versions']
+    for name in names:
+        key = PREFIX + name
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def author_recipes_version(author_id):
+    return f'recipes:author:{author_id}'
+
+
+def recipe_version(recipe_id):
+    return f'recipes:recipe:{recipe_id}'
+
+
+def user_version(user_id):
+    """Избранное, корзина и подписки пользователя."""
+    return f'user:{user_id}'
+
+
+def recipe_versions(recipe_id, author_id):
+    """Счётчики версий закэшированных ответов с этим рецептом."""
+    return (
+        ALL_RECIPES_VERSION,
+        author_recipes_version(author_id),
+        recipe_version(recipe_id),
+    )
@@ -0,0 +1,154 @@
+"""Подготовка уменьшенных вариантов изображений рецептов вне запроса."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from .cache_versions import bump_versions, recipe_versions
+from .models import Recipe, RecipeImageTask
+
+VARIANTS = (
+    ('thumbnail', 160),
+    ('card', 480),
+    ('full', 1280),
+)
+VARIANT_FIELDS = [f'image_{name}' for name, _ in VARIANTS]
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+STALE_AFTER = timedelta(minutes=10)
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix='recipe-images'
+)
+
+
+def reset_variants(recipe):
+    """Сбрасывает варианты, пока не готовы новые, отдаётся оригинал.
+
+    Файлы старых вариантов удаляются после коммита: при откате поля
+    по-прежнему ссылаются на них.
+    """
+    files = []
+    for field in VARIANT_FIELDS:
+        variant = getattr(recipe, field)
+        if variant:
+            files.append((variant.storage, variant.name))
+        setattr(recipe, field, '')
+    if files:
+        transaction.on_commit(partial(delete_files, files))
+
+
+def delete_files(files):
+    for storage, name in files:
+        storage.delete(name)
+
+
+def schedule_image_processing(recipe):
+    """Ставит задачу в очередь; обработка начнётся после коммита."""
+    task = RecipeImageTask.objects.create(recipe=recipe)
+    transaction.on_commit(lambda: _executor.submit(run_task, task.pk))
+    return task
+
+
+def get_image_format():
+    """Формат вариантов; без поддержки WebP в Pillow используется JPEG."""
+    image_format = settings.RECIPE_IMAGE_FORMAT.upper()
+    if image_format == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return image_format
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, image_format, quality=82, optimize=True)
+    return buffer.getvalue()
+
+
+def build_variants(recipe):
+    image_format = get_image_format()
+    with recipe.image.open('rb') as original:
+        image = ImageOps.exif_transpose(Image.open(original))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+    for name, size in VARIANTS:
+        field = getattr(recipe, f'image_{name}')
+        if field:
+            field.delete(save=False)
+        field.save(
+            f'{stem}_{name}.{EXTENSIONS[image_format]}',
+            ContentFile(render_variant(image, size, image_format)),
+            save=False
+        )
+
+
+def save_variants(recipe):
+    """Сохраняет варианты, если изображение рецепта не сменилось."""
+    build_variants(recipe)
+    updated = Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name
+    ).update(**{
+        field: getattr(recipe, field).name for field in VARIANT_FIELDS
+    })
+    if updated:
+        bump_versions(*recipe_versions(recipe.pk, recipe.author_id))
+    else:
+        for field in VARIANT_FIELDS:
+            getattr(recipe, field).delete(save=False)
+
+
+def process_task(task_id):
+    claimed = RecipeImageTask.objects.filter(
+        pk=task_id, status=RecipeImageTask.Status.PENDING
+    ).update(
+        status=RecipeImageTask.Status.PROCESSING, updated=timezone.now()
+    )
+    if not claimed:
+        return False
+    task = RecipeImageTask.objects.select_related('recipe').get(pk=task_id)
+    try:
+        save_variants(task.recipe)
+    except Exception as error:
+        task.status = RecipeImageTask.Status.FAILED
+        task.error = repr(error)
+    else:
+        task.status = RecipeImageTask.Status.DONE
+        task.error = ''
+    task.attempts += 1
+    task.save(update_fields=['status', 'error', 'attempts', 'updated'])
+    return task.status == RecipeImageTask.Status.DONE
+
+
+def run_task(task_id):
+    """Обработка задачи в потоке пула со своим соединением с БД."""
+    close_old_connections()
+    try:
+        process_task(task_id)
+    finally:
+        connection.close()
+
+
+def requeue_stale_tasks():
+    """Возвращает в очередь задачи, зависшие после падения процесса."""
+    return RecipeImageTask.objects.filter(
+        status=RecipeImageTask.Status.PROCESSING,
+        updated__lt=timezone.now() - STALE_AFTER
+    ).update(status=RecipeImageTask.Status.PENDING)
+
+
+def pending_task_ids():
+    return RecipeImageTask.objects.filter(
+        status=RecipeImageTask.Status.PENDING
+    ).values_list('pk', flat=True)
@@ -0,0 +1,96 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения."""
+import bisect
+from threading import Lock
+from types import SimpleNamespace
+
+from .cache_versions import bump_versions, get_versions
+from .models import Ingredients
+
+VERSION_NAME = 'ingredients'
+
+_lock = Lock()
+_state = SimpleNamespace(index=None)
+
+
+def word_starts(key):
+    """Позиции начала слов в key, кроме первого."""
+    return [
+        position for position in range(1, len(key))
+        if key[position].isalnum() and not key[position - 1].isalnum()
+    ]
+
+
+class IngredientIndex:
+    """Отсортированный по названию в нижнем регистре список ингредиентов.
+
+    Совпадения по началу названия ищутся бинарным поиском по keys. Для
+    совпадений с начала других слов названия («мо» в «сыр моцарелла»)
+    есть второй отсортированный список word_keys: хвосты названий,
+    начинающиеся с каждого следующего слова, и позиции их ингредиентов.
+    Оба поиска логарифмические, полный перебор не нужен.
+    """
+
+    def __init__(self, ingredients, version=None):
+        rows = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        self.keys = [row[0] for row in rows]
+        self.items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        words = sorted(
+            (key[start:], position)
+            for position, key in enumerate(self.keys)
+            for start in word_starts(key)
+        )
+        self.word_keys = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+        self.version = version
+
+    @staticmethod
+    def bounds(keys, query):
+        start = bisect.bisect_left(keys, query)
+        return start, bisect.bisect_right(keys, query + chr(0x10FFFF), start)
+
+    def search(self, query, limit):
+        query = query.casefold()
+        start, end = self.bounds(self.keys, query)
+        result = self.items[start:min(end, start + limit)]
+        if len(result) >= limit:
+            return result
+        seen = set(range(start, end))
+        word_start, word_end = self.bounds(self.word_keys, query)
+        for position in self.word_positions[word_start:word_end]:
+            if position in seen:
+                continue
+            seen.add(position)
+            result.append(self.items[position])
+            if len(result) >= limit:
+                break
+        return result
+
+
+def get_ingredient_index():
+    """Индекс текущей версии, при необходимости построенный заново."""
+    version, = get_versions(VERSION_NAME)
+    with _lock:
+        if _state.index is None or _state.index.version != version:
+            _state.index = IngredientIndex(
+                Ingredients.objects.values_list(
+                    'id', 'name', 'measurement_unit'
+                ).iterator(),
+                version
+            )
+        return _state.index
+
+
+def invalidate_ingredient_index():
+    """Сбрасывает индекс во всех процессах через общий счётчик версий.
+
+    Вызывается после коммита: иначе параллельный запрос успел бы
+    построить индекс из старых строк под новой версией.
+    """
+    _state.index = None
+    bump_versions(VERSION_NAME)
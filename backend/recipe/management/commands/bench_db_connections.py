@@ -0,0 +1,111 @@
+from concurrent.futures import ThreadPoolExecutor
+from statistics import mean
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from .query_report import percentile
+
+User = get_user_model()
+
+ENDPOINTS = ('/api/tags/', '/api/recipes/')
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку /api/tags/ и /api/recipes/ при новом '
+        'соединении с БД на каждый запрос, постоянном соединении и пуле. '
+        'Запросы проходят через WSGI-обработчик, поэтому соединения '
+        'закрываются и переиспользуются так же, как под gunicorn.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--pool-size', type=int, default=4)
+
+    def modes(self, pool_size):
+        modes = {
+            'новое соединение': {'CONN_MAX_AGE': 0, 'POOL': None},
+            'постоянное соединение': {'CONN_MAX_AGE': 600, 'POOL': None},
+        }
+        if hasattr(connection, 'pool'):
+            modes['пул'] = {
+                'CONN_MAX_AGE': 0,
+                'POOL': {'SIZE': pool_size, 'TIMEOUT': 10, 'STALE_AFTER': 30},
+            }
+        else:
+            self.stderr.write(
+                f'Бэкенд {connection.settings_dict["ENGINE"]} без пула, '
+                'режим пула пропущен.'
+            )
+        return modes
+
+    def request(self, environ):
+        started = perf_counter()
+        response = self.handler(dict(environ), start_response)
+        for _ in response:
+            pass
+        response.close()
+        return (perf_counter() - started) * 1000
+
+    def measure(self, environ, repeat, threads):
+        self.request(environ)
+        if threads == 1:
+            timings = [self.request(environ) for _ in range(repeat)]
+        else:
+            with ThreadPoolExecutor(threads) as executor:
+                timings = list(executor.map(
+                    lambda _: self.request(environ), range(repeat)
+                ))
+        timings.sort()
+        return timings
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by('id').first()
+        if user is None:
+            raise CommandError(
+                'В базе нет данных, сначала выполните seed_benchmark.'
+            )
+        token, _ = Token.objects.get_or_create(user=user)
+        factory = RequestFactory()
+        requests = {
+            url: factory.get(
+                url, HTTP_AUTHORIZATION=f'Token {token.key}'
+            ).environ
+            for url in ENDPOINTS
+        }
+        self.handler = WSGIHandler()
+        settings_dict = connection.settings_dict
+        original = {
+            key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'POOL')
+        }
+        try:
+            for mode, overrides in self.modes(options['pool_size']).items():
+                connections.close_all()
+                settings_dict.update(overrides)
+                for url, environ in requests.items():
+                    timings = self.measure(
+                        environ, options['repeat'], options['threads']
+                    )
+                    self.stdout.write(
+                        f'{mode:24} {url:16} '
+                        f'p50 {percentile(timings, 0.5):7.2f} мс  '
+                        f'p95 {percentile(timings, 0.95):7.2f} мс  '
+                        f'среднее {mean(timings):7.2f} мс'
+                    )
+                connections.close_all()
+                pool = getattr(connection, 'pool', None)
+                if pool is not None:
+                    pool.close_idle()
+        finally:
+            settings_dict.update(original)
@@ -0,0 +1,104 @@
+import base64
+import json
+import multiprocessing
+import os
+import resource
+import tempfile
+from io import BytesIO
+from time import monotonic
+
+from api.uploads import use_recipe_image_upload
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management.base import BaseCommand
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from drf_extra_fields.fields import HybridImageField
+from PIL import Image
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+
+def make_image(size_mb):
+    """PNG из случайного шума, который почти не сжимается."""
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    buffer = BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        buffer, 'PNG', compress_level=1
+    )
+    buffer.name = 'image.png'
+    buffer.seek(0)
+    return buffer
+
+
+def parse_image(path, content_type, multipart):
+    """Разбирает тело запроса из файла так же, как это делает API."""
+    with open(path, 'rb') as body:
+        request = WSGIRequest({
+            'REQUEST_METHOD': 'POST',
+            'PATH_INFO': '/',
+            'SERVER_NAME': 'testserver',
+            'SERVER_PORT': '80',
+            'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(os.path.getsize(path)),
+            'wsgi.input': body,
+            'wsgi.url_scheme': 'http',
+        })
+        if multipart:
+            use_recipe_image_upload(request)
+        data = Request(
+            request, parsers=[JSONParser(), MultiPartParser()]
+        ).data
+        return HybridImageField().run_validation(data['image'])
+
+
+def measure(queue, *args):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = monotonic()
+    parse_image(*args)
+    elapsed = monotonic() - started
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put(((after - before) / 1024, elapsed))
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает прирост пикового RSS при загрузке изображения рецепта '
+        'в JSON с base64 и в multipart/form-data. Каждый способ '
+        'измеряется в отдельном процессе.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=float, default=10)
+
+    def write_bodies(self, directory, image):
+        content = image.getvalue()
+        json_path = os.path.join(directory, 'body.json')
+        with open(json_path, 'w') as body:
+            json.dump({
+                'image': 'data:image/png;base64,'
+                + base64.b64encode(content).decode()
+            }, body)
+        multipart_path = os.path.join(directory, 'body.multipart')
+        with open(multipart_path, 'wb') as body:
+            body.write(encode_multipart(BOUNDARY, {'image': image}))
+        return (
+            ('JSON с base64', json_path, 'application/json', False),
+            ('multipart/form-data', multipart_path, MULTIPART_CONTENT, True),
+        )
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        image = make_image(options['size_mb'])
+        self.stdout.write(
+            f'Изображение: {len(image.getvalue()) / 1024 / 1024:.1f} МБ'
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            for title, *args in self.write_bodies(directory, image):
+                queue = context.Queue()
+                process = context.Process(target=measure, args=(queue, *args))
+                process.start()
+                peak, elapsed = queue.get()
+                process.join()
+                self.stdout.write(
+                    f'{title}: прирост пикового RSS {peak:.1f} МБ, '
+                    f'{elapsed:.2f} с'
+                )
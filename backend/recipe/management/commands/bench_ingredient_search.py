@@ -0,0 +1,41 @@
+from timeit import timeit
+
+from django.core.management.base import BaseCommand
+from recipe.ingredient_index import get_ingredient_index
+from recipe.models import Ingredients
+
+QUERIES = ['а', 'мо', 'сыр', 'молоко', 'сыр мо', 'моцарелла', 'перец черн',
+           'несуществующий']
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает поиск ингредиентов по индексу в памяти и через ORM.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries', nargs='*', default=QUERIES,
+            help='Запросы; по умолчанию короткие и длинные префиксы, '
+                 'начало второго слова и запрос без совпадений.'
+        )
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=20)
+
+    def handle(self, *args, **options):
+        repeat, limit = options['repeat'], options['limit']
+        index = get_ingredient_index()
+        for query in options['queries']:
+            index_time = timeit(
+                lambda: index.search(query, limit), number=repeat
+            )
+            orm_time = timeit(
+                lambda: list(
+                    Ingredients.objects.filter(
+                        name__istartswith=query
+                    ).values('id', 'name', 'measurement_unit')
+                ),
+                number=repeat
+            )
+            self.stdout.write(
+                f'{query!r}: индекс {index_time / repeat * 1e6:.1f} мкс, '
+                f'ORM {orm_time / repeat * 1e6:.1f} мкс'
+            )
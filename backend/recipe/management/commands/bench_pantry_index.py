@@ -0,0 +1,120 @@
+import random
+from statistics import mean
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, FloatField, Q
+from django.db.models.functions import Cast
+from recipe.models import RecipesIngredients
+from recipe.pantry_index import PantryIndex, get_pantry_index, popcount
+
+from .query_report import percentile
+from .seed_benchmark import power_law_weights
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет подбор рецептов по продуктам: построение обратного '
+        'индекса, ранжирование и точечное обновление. По умолчанию на '
+        'синтетических данных, с --database на рецептах из базы вместе '
+        'с тем же ранжированием одним SQL-запросом.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--alpha', type=float, default=1.0)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--pantry-sizes', type=int, nargs='*', default=[5, 10, 20]
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--database',
+            action='store_true',
+            help='Брать рецепты из базы и сравнить с SQL.'
+        )
+
+    def synthetic_rows(self, recipes, ingredients, alpha):
+        """Составы по 5-30 ингредиентов, популярность по степенному закону."""
+        items = list(range(1, ingredients + 1))
+        weights = power_law_weights(ingredients, alpha)
+        for recipe_id in range(1, recipes + 1):
+            composition = set(self.random.choices(
+                items, cum_weights=weights, k=self.random.randint(5, 30)
+            ))
+            for ingredient_id in composition:
+                yield recipe_id, ingredient_id
+
+    def timed(self, name, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            result = function()
+            timings.append((perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{name:40} p50 {percentile(timings, 0.5):8.2f} мс  '
+            f'p95 {percentile(timings, 0.95):8.2f} мс  '
+            f'среднее {mean(timings):8.2f} мс'
+        )
+        return result
+
+    @staticmethod
+    def first_page(matches, size=6):
+        return len(matches), matches[:size]
+
+    @staticmethod
+    def sql_match(pantry):
+        return list(RecipesIngredients.objects.values('formula').annotate(
+            total=Count('id'),
+            matched=Count('id', filter=Q(ingredient_id__in=pantry)),
+        ).filter(matched__gt=0).annotate(
+            coverage=Cast('matched', FloatField()) / F('total')
+        ).order_by('-coverage', '-matched', '-formula').values_list(
+            'formula', 'matched', 'total'
+        )[:6])
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        started = perf_counter()
+        if options['database']:
+            index = get_pantry_index()
+        else:
+            index = PantryIndex.build(self.synthetic_rows(
+                options['recipes'], options['ingredients'], options['alpha']
+            ))
+        self.stdout.write(
+            f'Рецептов: {len(index.recipes)}, ингредиентов: '
+            f'{len(index.postings)}, построение '
+            f'{(perf_counter() - started) * 1000:.0f} мс'
+        )
+        ingredients = sorted(
+            index.postings, key=lambda pk: popcount(index.postings[pk]),
+            reverse=True
+        )
+        weights = power_law_weights(len(ingredients), options['alpha'])
+        repeat = options['repeat']
+        for size in options['pantry_sizes']:
+            pantry = set(self.random.choices(
+                ingredients, cum_weights=weights, k=size
+            ))
+            found, _ = self.timed(
+                f'индекс, продуктов {len(pantry)}',
+                lambda: self.first_page(index.match(pantry)), repeat
+            )
+            self.stdout.write(f'  найдено рецептов: {found}')
+            if options['database']:
+                self.timed(
+                    f'SQL, продуктов {len(pantry)}',
+                    lambda: self.sql_match(pantry), max(1, repeat // 10)
+                )
+        recipe_ids = index.recipe_ids
+        self.timed(
+            'обновление состава рецепта',
+            lambda: index.with_recipe(
+                self.random.choice(recipe_ids),
+                self.random.sample(ingredients, 10)
+            ),
+            repeat
+        )
@@ -0,0 +1,108 @@
+import re
+from types import SimpleNamespace
+
+from api.filters import RecipeFilter
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.http import QueryDict
+from recipe.models import (Favorite, Recipe, RecipesIngredients, ShoppingCart,
+                           Tag)
+
+User = get_user_model()
+
+CHECKED_TABLES = (
+    Recipe._meta.db_table,
+    Favorite._meta.db_table,
+    ShoppingCart._meta.db_table,
+    RecipesIngredients._meta.db_table,
+)
+SEQ_SCAN_PATTERNS = {
+    'postgresql': r'Seq Scan on "?({tables})"?\b',
+    'sqlite': r'\bSCAN (?:TABLE )?"?({tables})"?(?! USING)',
+}
+
+
+def sample_values():
+    author = User.objects.annotate(
+        recipes_count=Count('recipe')
+    ).order_by('-recipes_count').first()
+    user = User.objects.annotate(
+        favorites_count=Count('favorite_user')
+    ).order_by('-favorites_count').first()
+    tag = Tag.objects.first()
+    if author is None or user is None or tag is None:
+        raise CommandError('В базе нет пользователей, рецептов или тегов.')
+    return author, user, tag
+
+
+def filter_cases():
+    """Пользователь для фильтров избранного и корзины и строки запросов."""
+    author, user, tag = sample_values()
+    return user, {
+        'лента': '',
+        'автор': f'author={author.id}',
+        'несколько авторов': f'author={author.id}&author={user.id}',
+        'тег': f'tags={tag.slug}',
+        'автор и тег': f'author={author.id}&tags={tag.slug}',
+        'избранное': 'is_favorited=1',
+        'корзина': 'is_in_shopping_cart=1',
+        'избранное и тег': f'is_favorited=1&tags={tag.slug}',
+    }
+
+
+def explain_filter(query, user):
+    """План запроса первой страницы ленты с фильтрами query."""
+    queryset = RecipeFilter(
+        QueryDict(query), queryset=Recipe.objects.all(),
+        request=SimpleNamespace(user=user)
+    ).qs
+    return queryset[:6].explain()
+
+
+def sequential_scans(plan):
+    """Большие таблицы, которые план читает последовательно."""
+    if connection.vendor not in SEQ_SCAN_PATTERNS:
+        raise CommandError(
+            f'EXPLAIN для {connection.vendor} не поддерживается.'
+        )
+    seq_scan = re.compile(SEQ_SCAN_PATTERNS[connection.vendor].format(
+        tables='|'.join(CHECKED_TABLES)
+    ))
+    return sorted(set(seq_scan.findall(plan)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN для основных комбинаций фильтров ленты рецептов '
+        'и сообщает о последовательном сканировании больших таблиц. '
+        'Запускать на базе с реалистичным объёмом данных; то же проверяет '
+        'тест recipe.tests.RecipeFilterPlanTest на синтетических данных.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Печатать планы запросов целиком.'
+        )
+
+    def handle(self, *args, **options):
+        user, cases = filter_cases()
+        failed = []
+        for title, query in cases.items():
+            plan = explain_filter(query, user)
+            scans = sequential_scans(plan)
+            if scans:
+                failed.append(title)
+            self.stdout.write(
+                f'{title}: '
+                + (f'seq scan {", ".join(scans)}' if scans else 'index scan')
+            )
+            if options['verbose_plans']:
+                self.stdout.write(plan)
+        if failed:
+            raise CommandError(
+                'Последовательное сканирование: ' + ', '.join(failed)
+            )
@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+from itertools import islice
+from time import monotonic
+
+from api.exporters import Echo
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipe.cache_versions import COMMON_RECIPES_VERSION, bump_versions
+from recipe.ingredient_index import invalidate_ingredient_index
+from recipe.models import Ingredients
+
+DEFAULT_PATH = os.path.join(
+    os.path.dirname(settings.BASE_DIR), 'data', 'ingredients.csv'
+)
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """Построчно читает JSON-массив объектов, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer, position, started = '', 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[':
+            started = started or buffer[position] == '['
+            position += 1
+        if position < len(buffer) and buffer[position] == ']' and started:
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                if buffer[position:].strip():
+                    raise
+                return
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        yield item['name'], item['measurement_unit']
+
+
+class IteratorFile:
+    """Файлоподобная обёртка над итератором строк для COPY FROM STDIN."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        data = self.buffer
+        self.buffer = data[size:]
+        return data[:size]
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV- или JSON-файла.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.'
+        )
+
+    def rows(self, path):
+        readers = {'.csv': read_csv, '.json': read_json}
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in readers:
+            raise CommandError('Поддерживаются только файлы .csv и .json')
+        with open(path, encoding='utf-8') as file:
+            for name, measurement_unit in readers[extension](file):
+                name, measurement_unit = name.strip(), measurement_unit.strip()
+                if name:
+                    self.count += 1
+                    yield name, measurement_unit
+
+    def load_with_copy(self, rows):
+        writer = csv.writer(Echo())
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredients_load '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.cursor.copy_expert(
+                'COPY ingredients_load (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                IteratorFile(writer.writerow(row) for row in rows)
+            )
+            cursor.execute(
+                f'INSERT INTO {Ingredients._meta.db_table} '
+                '(name, measurement_unit) '
+                'SELECT DISTINCT ON (name) name, measurement_unit '
+                'FROM ingredients_load ORDER BY name '
+                'ON CONFLICT (name) DO UPDATE '
+                'SET measurement_unit = EXCLUDED.measurement_unit '
+                f'WHERE {Ingredients._meta.db_table}.measurement_unit '
+                'IS DISTINCT FROM EXCLUDED.measurement_unit'
+            )
+            return cursor.rowcount
+
+    def load_with_orm(self, rows, batch_size):
+        changed = 0
+        while True:
+            batch = dict(islice(rows, batch_size))
+            if not batch:
+                return changed
+            with transaction.atomic():
+                existing = {
+                    ingredient.name: ingredient
+                    for ingredient in Ingredients.objects.filter(
+                        name__in=batch
+                    )
+                }
+                updated = []
+                for name, ingredient in existing.items():
+                    if ingredient.measurement_unit != batch[name]:
+                        ingredient.measurement_unit = batch[name]
+                        updated.append(ingredient)
+                Ingredients.objects.bulk_update(
+                    updated, ['measurement_unit'], batch_size=batch_size
+                )
+                created = Ingredients.objects.bulk_create(
+                    (
+                        Ingredients(name=name, measurement_unit=unit)
+                        for name, unit in batch.items()
+                        if name not in existing
+                    ),
+                    batch_size=batch_size,
+                    ignore_conflicts=True
+                )
+            changed += len(updated) + len(created)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        self.count = 0
+        rows = self.rows(path)
+        started = monotonic()
+        if connection.vendor == 'postgresql' and not options['no_copy']:
+            changed = self.load_with_copy(rows)
+        else:
+            changed = self.load_with_orm(rows, options['batch_size'])
+        elapsed = max(monotonic() - started, 1e-6)
+        invalidate_ingredient_index()
+        if changed:
+            bump_versions(COMMON_RECIPES_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {self.count}, '
+            f'добавлено или изменено: {changed} '
+            f'за {elapsed:.2f} с ({self.count / elapsed:.0f} строк/с)'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from recipe.images import pending_task_ids, process_task, requeue_stale_tasks
+
+
+class Command(BaseCommand):
+    help = (
+        'Обрабатывает очередь вариантов изображений рецептов, в том числе '
+        'задачи, не завершённые из-за перезапуска сервера.'
+    )
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_tasks()
+        done = failed = 0
+        for task_id in list(pending_task_ids()):
+            if process_task(task_id):
+                done += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Возвращено в очередь: {requeued}, обработано: {done}, '
+            f'с ошибкой или пропущено: {failed}'
+        ))
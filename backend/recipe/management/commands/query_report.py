@@ -0,0 +1,78 @@
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+METRICS = ('total_ms', 'queries', 'db_ms', 'serializer_ms')
+
+
+def percentile(values, fraction):
+    """Процентиль по ближайшему рангу для отсортированного списка."""
+    return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def read_records(path):
+    with open(path, encoding='utf-8') as log:
+        for line in log:
+            start = line.find('{')
+            if start == -1:
+                continue
+            try:
+                yield json.loads(line[start:])
+            except json.JSONDecodeError:
+                continue
+
+
+class Command(BaseCommand):
+    help = (
+        'Сводка журнала QueryProfilingMiddleware: p50 и p95 времени, '
+        'числа запросов и времени БД и сериализации по эндпоинтам.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*', default=[settings.QUERY_PROFILING_LOG]
+        )
+        parser.add_argument(
+            '--sort',
+            choices=METRICS,
+            default='queries',
+            help='Метрика, по p95 которой сортируются эндпоинты.'
+        )
+
+    def handle(self, *args, **options):
+        endpoints = defaultdict(lambda: defaultdict(list))
+        for path in options['paths']:
+            if not os.path.exists(path):
+                raise CommandError(f'Файл {path} не найден')
+            for record in read_records(path):
+                stats = endpoints[record['endpoint']]
+                for metric in METRICS:
+                    stats[metric].append(record[metric])
+                stats['over_budget'].append(record['over_budget'])
+        if not endpoints:
+            raise CommandError('В журнале нет записей профилирования.')
+        for stats in endpoints.values():
+            for metric in METRICS:
+                stats[metric].sort()
+        self.stdout.write(
+            f'{"эндпоинт":40} {"вызовы":>8} '
+            + ' '.join(f'{metric + " p50/p95":>22}' for metric in METRICS)
+            + f' {"сверх бюджета":>14}'
+        )
+        for endpoint, stats in sorted(
+            endpoints.items(),
+            key=lambda item: percentile(item[1][options['sort']], 0.95),
+            reverse=True
+        ):
+            cells = ' '.join(
+                f'{percentile(stats[metric], 0.5):>10g}/'
+                f'{percentile(stats[metric], 0.95):<11g}'
+                for metric in METRICS
+            )
+            self.stdout.write(
+                f'{endpoint:40} {len(stats["over_budget"]):>8} {cells} '
+                f'{sum(stats["over_budget"]):>14}'
+            )
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+from recipe.models import RecipesIngredients, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги списков покупок по корзинам пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить таблицу с корзинами, ничего не меняя.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    @staticmethod
+    def expected_totals():
+        return {
+            (user, ingredient): total
+            for user, ingredient, total in RecipesIngredients.objects.filter(
+                formula__cart_recipe__isnull=False
+            ).values_list(
+                'formula__cart_recipe__user', 'ingredient'
+            ).order_by().annotate(total=Sum('amount')).iterator()
+        }
+
+    @staticmethod
+    def stored_totals():
+        items = ShoppingListItem.objects.values_list(
+            'user', 'ingredient', 'total'
+        )
+        return {
+            (user, ingredient): total
+            for user, ingredient, total in items.iterator()
+        }
+
+    def verify(self):
+        expected = self.expected_totals()
+        stored = self.stored_totals()
+        mismatches = [
+            (key, expected.get(key), stored.get(key))
+            for key in expected.keys() | stored.keys()
+            if expected.get(key) != stored.get(key)
+        ]
+        for (user, ingredient), wanted, actual in mismatches[:20]:
+            self.stderr.write(
+                f'user={user} ingredient={ingredient}: '
+                f'ожидалось {wanted}, в таблице {actual}'
+            )
+        return len(expected), len(mismatches)
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            with transaction.atomic():
+                ShoppingListItem.objects.all().delete()
+                ShoppingListItem.objects.bulk_create(
+                    (
+                        ShoppingListItem(
+                            user_id=user, ingredient_id=ingredient, total=total
+                        )
+                        for (user, ingredient), total
+                        in self.expected_totals().items()
+                    ),
+                    batch_size=options['batch_size']
+                )
+        rows, mismatches = self.verify()
+        if mismatches:
+            raise CommandError(f'Расхождений в списках покупок: {mismatches}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок согласованы, строк: {rows}'
+        ))
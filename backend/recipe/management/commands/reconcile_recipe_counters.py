@@ -0,0 +1,87 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from recipe.cache_versions import (ALL_RECIPES_VERSION, COMMON_RECIPES_VERSION,
+                                   bump_versions)
+from recipe.models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = (
+    ('favorites_count', Favorite),
+    ('carts_count', ShoppingCart),
+)
+
+
+def actual_count(model):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef('pk')).order_by().values(
+                'recipe'
+            ).annotate(count=Count('id')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        'Сверяет счётчики избранного и корзин в рецептах с таблицами '
+        'Favorite и ShoppingCart и исправляет расхождения (например, после '
+        'удаления пользователей или массовой загрузки данных).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить счётчики, ничего не меняя.'
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    @staticmethod
+    def mismatched():
+        queryset = Recipe.objects.annotate(**{
+            f'actual_{field}': actual_count(model)
+            for field, model in COUNTERS
+        })
+        condition = Q()
+        for field, _ in COUNTERS:
+            condition |= ~Q(**{field: F(f'actual_{field}')})
+        return queryset.filter(condition)
+
+    def report(self, recipes):
+        for recipe in recipes[:20]:
+            self.stderr.write(', '.join(
+                [f'recipe={recipe.id}'] + [
+                    f'{field}: в рецепте {getattr(recipe, field)}, '
+                    f'на самом деле {getattr(recipe, "actual_" + field)}'
+                    for field, _ in COUNTERS
+                ]
+            ))
+
+    def handle(self, *args, **options):
+        ids = list(self.mismatched().order_by('id').values_list(
+            'id', flat=True
+        ))
+        if options['check']:
+            if ids:
+                self.report(self.mismatched().order_by('id'))
+                raise CommandError(f'Расхождений в счётчиках: {len(ids)}')
+            self.stdout.write(self.style.SUCCESS(
+                'Счётчики рецептов согласованы'
+            ))
+            return
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            for start in range(0, len(ids), batch_size):
+                Recipe.objects.filter(
+                    id__in=ids[start:start + batch_size]
+                ).update(**{
+                    field: actual_count(model) for field, model in COUNTERS
+                })
+        if ids:
+            bump_versions(COMMON_RECIPES_VERSION, ALL_RECIPES_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Счётчики рецептов пересчитаны, исправлено рецептов: {len(ids)}'
+        ))
@@ -0,0 +1,159 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+from statistics import mean
+from time import perf_counter
+from urllib.parse import urlencode
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from recipe.models import Ingredients, Recipe, Tag
+from rest_framework.authtoken.models import Token
+
+from .query_report import percentile
+
+User = get_user_model()
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, check=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет задержку и число SQL-запросов основных эндпоинтов API '
+        'через тестовый клиент Django и сохраняет результат в JSON. '
+        'Данные для замеров создаёт команда seed_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--output', help='Файл для результатов, по умолчанию stdout.'
+        )
+        parser.add_argument(
+            '--compare', help='JSON прошлого запуска для сравнения.'
+        )
+
+    def sample_values(self):
+        user = User.objects.annotate(
+            cart_count=Count('cart', distinct=True),
+            follow_count=Count('follower', distinct=True),
+        ).order_by('-cart_count', '-follow_count').first()
+        author = User.objects.annotate(
+            recipes_count=Count('recipe')
+        ).order_by('-recipes_count').first()
+        recipe = Recipe.objects.order_by('-id').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredients.objects.order_by('id').first()
+        if None in (user, author, recipe, tag, ingredient):
+            raise CommandError(
+                'В базе нет данных, сначала выполните seed_benchmark.'
+            )
+        return user, author, recipe, tag, ingredient
+
+    def endpoints(self):
+        user, author, recipe, tag, ingredient = self.sample_values()
+        feed = '/api/recipes/'
+        return user, {
+            'лента': feed,
+            'лента, курсор': f'{feed}?cursor=',
+            'лента, автор': f'{feed}?author={author.id}',
+            'лента, тег': f'{feed}?tags={tag.slug}',
+            'лента, избранное': f'{feed}?is_favorited=1',
+            'лента, корзина': f'{feed}?is_in_shopping_cart=1',
+            'лента, дальняя страница': f'{feed}?page=50',
+            'лента, популярные': f'{feed}?ordering=-favorites_count',
+            'лента, поиск': f'{feed}?' + urlencode(
+                {'search': ingredient.name.split()[0]}
+            ),
+            'рецепт': f'{feed}{recipe.id}/',
+            'подписки': '/api/users/subscriptions/?recipes_limit=3',
+            'список покупок': f'{feed}download_shopping_cart/',
+            'поиск ингредиентов': '/api/ingredients/?' + urlencode(
+                {'name': ingredient.name[:2]}
+            ),
+        }
+
+    @staticmethod
+    def request(client, url):
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    def measure(self, client, url, repeat, warmup):
+        for _ in range(warmup):
+            self.request(client, url)
+        timings = []
+        queries = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = perf_counter()
+                response = self.request(client, url)
+                timings.append((perf_counter() - started) * 1000)
+            queries.append(len(captured))
+        timings.sort()
+        return {
+            'url': url,
+            'status': response.status_code,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'mean_ms': round(mean(timings), 2),
+            'queries': max(queries),
+        }
+
+    def compare(self, path, results):
+        with open(path, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)['endpoints']
+        for name, result in results.items():
+            if name not in baseline:
+                continue
+            before = baseline[name]
+            self.stderr.write(
+                f'{name}: p50 {before["p50_ms"]} -> {result["p50_ms"]} мс, '
+                f'p95 {before["p95_ms"]} -> {result["p95_ms"]} мс, '
+                f'запросов {before["queries"]} -> {result["queries"]}'
+            )
+
+    def handle(self, *args, **options):
+        user, endpoints = self.endpoints()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        results = {}
+        for name, url in endpoints.items():
+            results[name] = self.measure(
+                client, url, options['repeat'], options['warmup']
+            )
+            self.stderr.write(
+                f'{name}: p50 {results[name]["p50_ms"]} мс, '
+                f'p95 {results[name]["p95_ms"]} мс, '
+                f'запросов {results[name]["queries"]}'
+            )
+        report = json.dumps({
+            'commit': current_commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'repeat': options['repeat'],
+            'endpoints': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+        if options['compare']:
+            self.compare(options['compare'], results)
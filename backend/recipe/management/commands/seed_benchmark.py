@@ -0,0 +1,231 @@
+import random
+from io import BytesIO
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image
+from recipe.cache_versions import (ALL_RECIPES_VERSION, COMMON_RECIPES_VERSION,
+                                   bump_versions)
+from recipe.models import (Favorite, Ingredients, Recipe, RecipesIngredients,
+                           ShoppingCart, Tag)
+from recipe.pantry_index import VERSION_NAME as PANTRY_VERSION
+from recipe.tag_registry import invalidate_tag_registry
+from users.models import Follow
+
+User = get_user_model()
+
+PREFIX = 'bench'
+PASSWORD = 'bench-password'
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F0C75E', '#4A90E2')
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса 1 / rank ** alpha для random.choices."""
+    return list(accumulate(1 / rank ** alpha for rank in range(1, count + 1)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими данными для бенчмарков: '
+        'пользователи, подписки, рецепты, избранное и корзины. '
+        'Популярность авторов и рецептов распределена по степенному закону.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='Среднее число рецептов в избранном.')
+        parser.add_argument('--carts', type=int, default=5,
+                            help='Среднее число рецептов в корзине.')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного распределения.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить данные предыдущего запуска.'
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=f'{PREFIX}-'
+            ).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        if not Ingredients.objects.exists():
+            call_command('load_ingredients', stdout=self.stdout)
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            tags = self.get_tags()
+            recipes = self.create_recipes(users, tags, options['recipes'])
+            self.create_follows(users, options['follows'], options['alpha'])
+            for model, average in (
+                (Favorite, options['favorites']),
+                (ShoppingCart, options['carts']),
+            ):
+                self.create_user_recipes(
+                    model, users, recipes, average, options['alpha']
+                )
+        call_command('rebuild_shopping_list', stdout=self.stdout)
+        call_command('update_search_vectors', stdout=self.stdout)
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        bump_versions(
+            COMMON_RECIPES_VERSION, ALL_RECIPES_VERSION, PANTRY_VERSION
+        )
+        invalidate_tag_registry()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}'
+        ))
+
+    def create_users(self, count):
+        start = User.objects.filter(
+            username__startswith=f'{PREFIX}-'
+        ).count()
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{PREFIX}-{number}',
+                    email=f'{PREFIX}-{number}@example.com',
+                    first_name='Бенчмарк',
+                    last_name=str(number),
+                    password=password,
+                )
+                for number in range(start, start + count)
+            ),
+            batch_size=self.batch_size
+        )
+        return list(User.objects.filter(
+            username__startswith=f'{PREFIX}-'
+        ).values_list('id', flat=True))[start:]
+
+    def get_tags(self):
+        Tag.objects.bulk_create(
+            (
+                Tag(name=f'{PREFIX}-{number}', slug=f'{PREFIX}-{number}',
+                    color=color)
+                for number, color in enumerate(TAG_COLORS)
+            ),
+            ignore_conflicts=True
+        )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def save_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (480, 320), '#E26C2D').save(buffer, 'JPEG')
+        return default_storage.save(
+            f'recipe/media/{PREFIX}.jpg', ContentFile(buffer.getvalue())
+        )
+
+    def create_recipes(self, users, tags, count):
+        image = self.save_image()
+        start = Recipe.objects.filter(name__startswith=f'{PREFIX}-').count()
+        authors = self.random.choices(
+            users, cum_weights=power_law_weights(len(users), 1.0), k=count
+        )
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author,
+                    name=f'{PREFIX}-{start + number}',
+                    image=image,
+                    text='Синтетический рецепт для бенчмарка.',
+                    cooking_time=self.random.randint(5, 180),
+                )
+                for number, author in enumerate(authors)
+            ),
+            batch_size=self.batch_size
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith=f'{PREFIX}-'
+        ).order_by('id').values_list('id', flat=True))[start:]
+        ingredients = list(Ingredients.objects.values_list('id', flat=True))
+        RecipesIngredients.objects.bulk_create(
+            (
+                RecipesIngredients(
+                    formula_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient in self.random.sample(
+                    ingredients,
+                    min(len(ingredients), self.random.randint(5, 30))
+                )
+            ),
+            batch_size=self.batch_size
+        )
+        Recipe.tags.through.objects.bulk_create(
+            (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe in recipes
+                for tag in self.random.sample(
+                    tags, min(len(tags), self.random.randint(1, 3))
+                )
+            ),
+            batch_size=self.batch_size
+        )
+        return recipes
+
+    def sample_counts(self, users, average, alpha):
+        """Число связей на пользователя с длинным хвостом и средним average.
+
+        При alpha <= 1 у распределения Парето нет конечного среднего,
+        поэтому форма ограничена снизу.
+        """
+        shape = max(alpha, 1.05) + 1
+        scale = average * (shape - 1) / shape
+        return [
+            int(scale * self.random.paretovariate(shape)) for _ in users
+        ]
+
+    def pick_popular(self, items, weights, count, exclude=None):
+        chosen = set(self.random.choices(items, cum_weights=weights, k=count))
+        chosen.discard(exclude)
+        return chosen
+
+    def create_follows(self, users, average, alpha):
+        authors = self.random.sample(users, len(users))
+        weights = power_law_weights(len(authors), alpha)
+        Follow.objects.bulk_create(
+            (
+                Follow(author_id=author, following_id=user)
+                for user, count in zip(
+                    users, self.sample_counts(users, average, alpha)
+                )
+                for author in self.pick_popular(
+                    authors, weights, min(count, len(users) - 1), user
+                )
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
+
+    def create_user_recipes(self, model, users, recipes, average, alpha):
+        popular = self.random.sample(recipes, len(recipes))
+        weights = power_law_weights(len(popular), alpha)
+        model.objects.bulk_create(
+            (
+                model(user_id=user, recipe_id=recipe)
+                for user, count in zip(
+                    users, self.sample_counts(users, average, alpha)
+                )
+                for recipe in self.pick_popular(
+                    popular, weights, min(count, len(recipes))
+                )
+            ),
+            batch_size=self.batch_size,
+            ignore_conflicts=True
+        )
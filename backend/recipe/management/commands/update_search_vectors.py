@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from recipe.models import Recipe
+from recipe.search import full_text_search_enabled, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает поисковые векторы рецептов. Нужна после массовой '
+        'загрузки данных в обход сигналов (bulk_create, update).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not full_text_search_enabled():
+            self.stdout.write(
+                'Полнотекстовый поиск работает только в PostgreSQL, '
+                'пересчитывать нечего.'
+            )
+            return
+        ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        updated = 0
+        for start in range(0, len(ids), options['batch_size']):
+            updated += update_search_vectors(Recipe.objects.filter(
+                id__in=ids[start:start + options['batch_size']]
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковые векторы пересчитаны, рецептов: {updated}'
+        ))
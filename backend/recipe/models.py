@@ -1,5 +1,6 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
 
@@ -71,6 +72,24 @@ class Recipe(models.Model):
         verbose_name='Изображение готового блюда',
         help_text='Загрузите изображение готового блюда'
     )
+    image_thumbnail = models.ImageField(
+        upload_to='recipe/media/variants/',
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра изображения'
+    )
+    image_card = models.ImageField(
+        upload_to='recipe/media/variants/',
+        blank=True,
+        editable=False,
+        verbose_name='Изображение для карточки'
+    )
+    image_full = models.ImageField(
+        upload_to='recipe/media/variants/',
+        blank=True,
+        editable=False,
+        verbose_name='Изображение для страницы рецепта'
+    )
     text = models.TextField(
         verbose_name='Введите описание рецепта',
         help_text='Введите описание рецепта, пошаговую инструкцию'
@@ -97,24 +116,83 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Время добавления рецепта'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном у пользователей'
+    )
+    carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзине у пользователей'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
 
     class Meta:
         """Meta for Title."""
 
         ordering = ('pub_date', )
+        indexes = [
+            models.Index(fields=['pub_date', 'id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date', 'id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['favorites_count', 'id'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['carts_count', 'id'],
+                         name='recipe_carts_count_idx'),
+        ]
 
     def __str__(self):
         """__str__ for Title."""
         return self.name
 
 
+class RecipeImageTask(models.Model):
+    """Задача на подготовку вариантов изображения рецепта."""
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'В очереди'
+        PROCESSING = 'processing', 'Обрабатывается'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='image_tasks',
+        verbose_name='Рецепт'
+    )
+    status = models.CharField(
+        max_length=16,
+        choices=Status.choices,
+        default=Status.PENDING,
+        db_index=True,
+        verbose_name='Статус'
+    )
+    attempts = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name='Попыток'
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('created', )
+
+
 class RecipesIngredients(models.Model):
     """Связующая модель."""
 
     formula = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
-        related_name='+',
+        related_name='recipe_ingredients',
         verbose_name='Рецепт'
     )
     ingredient = models.ForeignKey(
@@ -140,6 +218,10 @@ class RecipesIngredients(models.Model):
                 check=models.Q(amount__gte=1),
                 name='amount_gte_1'),
         ]
+        indexes = [
+            models.Index(fields=['formula', 'ingredient'],
+                         name='formula_ingredient_idx'),
+        ]
 
 
 class Favorite(models.Model):
@@ -161,6 +243,10 @@ class Favorite(models.Model):
             models.UniqueConstraint(fields=["user", "recipe"],
                                     name="user_recipe")
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
 
 
 class ShoppingCart(models.Model):
@@ -182,3 +268,94 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(fields=["user", "recipe"],
                                     name="user_recipes")
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='cart_recipe_user_idx'),
+        ]
+
+
+class ShoppingListItemManager(models.Manager):
+    """Инкрементальное обновление итогов списка покупок."""
+
+    @staticmethod
+    def recipe_amounts(recipe):
+        return dict(
+            RecipesIngredients.objects.filter(
+                formula=recipe
+            ).values_list('ingredient_id', 'amount')
+        )
+
+    def change_totals(self, user_ids, deltas):
+        """Прибавляет deltas {ingredient_id: количество} к итогам users."""
+        deltas = {
+            ingredient: delta for ingredient, delta in deltas.items() if delta
+        }
+        user_ids = list(user_ids)
+        if not deltas or not user_ids:
+            return
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=deltas)
+        items.update(total=models.F('total') + models.Case(
+            *(
+                models.When(ingredient_id=ingredient, then=models.Value(delta))
+                for ingredient, delta in deltas.items()
+            ),
+            output_field=models.IntegerField()
+        ))
+        existing = set(items.values_list('user_id', 'ingredient_id'))
+        self.bulk_create(
+            self.model(user_id=user, ingredient_id=ingredient, total=delta)
+            for user in user_ids
+            for ingredient, delta in deltas.items()
+            if delta > 0 and (user, ingredient) not in existing
+        )
+        items.filter(total__lte=0).delete()
+
+    def add_recipe(self, user, recipe):
+        self.change_totals([user.id], self.recipe_amounts(recipe))
+
+    def remove_recipe(self, user, recipe):
+        self.change_totals([user.id], {
+            ingredient: -amount
+            for ingredient, amount in self.recipe_amounts(recipe).items()
+        })
+
+    def change_recipe(self, recipe, old_amounts, new_amounts):
+        """Переносит изменение состава рецепта в списки покупок."""
+        self.change_totals(
+            ShoppingCart.objects.filter(
+                recipe=recipe
+            ).values_list('user_id', flat=True),
+            {
+                ingredient: (
+                    new_amounts.get(ingredient, 0)
+                    - old_amounts.get(ingredient, 0)
+                )
+                for ingredient in {*old_amounts, *new_amounts}
+            }
+        )
+
+
+class ShoppingListItem(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredients,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Ингредиент'
+    )
+    total = models.IntegerField(verbose_name='Количество')
+
+    objects = ShoppingListItemManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='user_ingredient')
+        ]
@@ -0,0 +1,242 @@
+"""Обратный индекс ингредиент -> рецепты для подбора по продуктам."""
+from collections import defaultdict
+from threading import Lock
+from types import SimpleNamespace
+
+from .cache_versions import bump_versions, get_versions
+from .models import RecipesIngredients
+
+VERSION_NAME = 'pantry'
+
+_lock = Lock()
+_state = SimpleNamespace(index=None)
+
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(bitmap):
+        return bin(bitmap).count('1')
+
+
+def positions_descending(bitmap):
+    while bitmap:
+        position = bitmap.bit_length() - 1
+        yield position
+        bitmap ^= 1 << position
+
+
+def add_bitmaps(bitmaps):
+    """Сумма масок по разрядам: бит i в planes[k] — k-й бит числа масок,
+    в которых установлен бит i."""
+    planes = []
+    for carry in bitmaps:
+        for digit, plane in enumerate(planes):
+            if not carry:
+                break
+            planes[digit], carry = plane ^ carry, plane & carry
+        if carry:
+            planes.append(carry)
+    return planes
+
+
+def to_bitmap(positions, size):
+    bits = bytearray((size + 7) // 8)
+    for position in positions:
+        bits[position >> 3] |= 1 << (position & 7)
+    return int.from_bytes(bits, 'little')
+
+
+class PantryMatches:
+    """Рецепты, подходящие под набор продуктов, в порядке ранжирования.
+
+    Хранит группы рецептов с одинаковыми (совпало, всего) в виде битовых
+    масок; id рецептов извлекаются только для запрошенного среза, поэтому
+    объект можно отдавать пагинатору как список.
+    """
+
+    def __init__(self, groups, recipe_ids):
+        self.groups = groups
+        self.recipe_ids = recipe_ids
+        self.total = sum(count for _, _, _, count in groups)
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        return self.iterate(0, self.total)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, _ = item.indices(self.total)
+            return list(self.iterate(start, stop))
+        if not 0 <= item < self.total:
+            raise IndexError(item)
+        return next(self.iterate(item, item + 1))
+
+    def iterate(self, start, stop):
+        """(recipe_id, совпало, всего) с позиции start до stop."""
+        skipped = 0
+        for matched, total, bitmap, count in self.groups:
+            if skipped + count <= start:
+                skipped += count
+                continue
+            for position in positions_descending(bitmap):
+                if skipped >= stop:
+                    return
+                if skipped >= start:
+                    yield self.recipe_ids[position], matched, total
+                skipped += 1
+
+
+class PantryIndex:
+    """Битовые маски рецептов по ингредиентам и по числу ингредиентов.
+
+    Бит i маски соответствует рецепту recipe_ids[i]; рецепты нумеруются
+    по возрастанию id, новые добавляются в конец. Индекс не меняется
+    после построения: изменение рецепта создаёт новый индекс, поэтому
+    потоки читают свою версию без блокировок.
+    """
+
+    def __init__(self, recipes, recipe_ids, postings, sizes, version=None):
+        self.recipes = recipes
+        self.recipe_ids = recipe_ids
+        self.postings = postings
+        self.sizes = sizes
+        self.version = version
+
+    @classmethod
+    def build(cls, rows, version=None):
+        """Индекс по парам (recipe_id, ingredient_id)."""
+        compositions = defaultdict(set)
+        for recipe_id, ingredient_id in rows:
+            compositions[recipe_id].add(ingredient_id)
+        recipe_ids = sorted(compositions)
+        recipes = {}
+        postings = defaultdict(list)
+        sizes = defaultdict(list)
+        for position, recipe_id in enumerate(recipe_ids):
+            composition = frozenset(compositions[recipe_id])
+            recipes[recipe_id] = (position, composition)
+            sizes[len(composition)].append(position)
+            for ingredient_id in composition:
+                postings[ingredient_id].append(position)
+        size = len(recipe_ids)
+        return cls(
+            recipes,
+            recipe_ids,
+            {
+                ingredient_id: to_bitmap(positions, size)
+                for ingredient_id, positions in postings.items()
+            },
+            {
+                total: to_bitmap(positions, size)
+                for total, positions in sizes.items()
+            },
+            version
+        )
+
+    def with_recipe(self, recipe_id, ingredient_ids, version=None):
+        """Новый индекс, где состав recipe_id равен ingredient_ids."""
+        position, old = self.recipes.get(recipe_id, (None, frozenset()))
+        new = frozenset(ingredient_ids)
+        if old == new:
+            return PantryIndex(
+                self.recipes, self.recipe_ids, self.postings, self.sizes,
+                version
+            )
+        recipe_ids = self.recipe_ids
+        if position is None:
+            position = len(recipe_ids)
+            recipe_ids = recipe_ids + [recipe_id]
+        bit = 1 << position
+        recipes = dict(self.recipes)
+        recipes[recipe_id] = (position, new)
+        postings = dict(self.postings)
+        for ingredient_id in old - new:
+            postings[ingredient_id] ^= bit
+        for ingredient_id in new - old:
+            postings[ingredient_id] = postings.get(ingredient_id, 0) | bit
+        sizes = dict(self.sizes)
+        if old:
+            sizes[len(old)] ^= bit
+        if new:
+            sizes[len(new)] = sizes.get(len(new), 0) | bit
+        return PantryIndex(recipes, recipe_ids, postings, sizes, version)
+
+    def match(self, ingredient_ids, min_coverage=0):
+        """Рецепты, где есть хотя бы один из ingredient_ids.
+
+        Число совпадений считается для всех рецептов сразу: маски
+        ингредиентов складываются в двоичные разряды. Затем рецепты
+        делятся на группы по (совпало, всего); группы упорядочены по доле
+        имеющихся ингредиентов и числу совпадений, внутри группы новые
+        рецепты первыми.
+        """
+        planes = add_bitmaps(
+            self.postings.get(ingredient_id, 0)
+            for ingredient_id in set(ingredient_ids)
+        )
+        everything = (1 << len(self.recipe_ids)) - 1
+        groups = []
+        for matched in range(1, 1 << len(planes)):
+            equal = everything
+            for digit, plane in enumerate(planes):
+                equal &= plane if matched >> digit & 1 else ~plane
+            if not equal:
+                continue
+            for total, recipes in self.sizes.items():
+                bitmap = equal & recipes
+                if bitmap and matched / total >= min_coverage:
+                    groups.append(
+                        (matched, total, bitmap, popcount(bitmap))
+                    )
+        groups.sort(key=lambda group: (group[0] / group[1], group[0]),
+                    reverse=True)
+        return PantryMatches(groups, self.recipe_ids)
+
+
+def get_pantry_index():
+    """Индекс текущей версии, при необходимости построенный заново."""
+    version, = get_versions(VERSION_NAME)
+    with _lock:
+        if _state.index is None or _state.index.version != version:
+            _state.index = PantryIndex.build(
+                RecipesIngredients.objects.values_list(
+                    'formula_id', 'ingredient_id'
+                ).iterator(),
+                version
+            )
+        return _state.index
+
+
+def update_pantry_index(recipe_id):
+    """Обновляет в индексе состав одного рецепта (или удаляет рецепт).
+
+    Актуальный индекс этого процесса заменяется исправленной копией,
+    остальные процессы увидят новую версию и перестроят свой. Повторный
+    вызов без изменений состава версию не меняет.
+    """
+    ingredient_ids = frozenset(RecipesIngredients.objects.filter(
+        formula_id=recipe_id
+    ).values_list('ingredient_id', flat=True))
+    with _lock:
+        current, = get_versions(VERSION_NAME)
+        index = _state.index
+        if index is not None and index.version == current and (
+            index.recipes.get(recipe_id, (None, frozenset()))[1]
+            == ingredient_ids
+        ):
+            return
+        bump_versions(VERSION_NAME)
+        version, = get_versions(VERSION_NAME)
+        if (
+            index is None
+            or index.version != current
+            or version != current + 1
+        ):
+            _state.index = None
+            return
+        _state.index = index.with_recipe(
+            recipe_id, ingredient_ids, version
+        )
@@ -0,0 +1,87 @@
+"""Полнотекстовый поиск рецептов.
+
+В PostgreSQL поиск идёт по хранимому полю Recipe.search_vector с
+GIN-индексом: название (вес A), названия ингредиентов (B) и описание
+(C), результаты упорядочены по SearchRank. Поле обновляют сигналы
+после коммита и команда update_search_vectors. На других СУБД поле
+не заполняется, а поиск сводится к icontains по тем же полям.
+"""
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection, connections
+from django.db.models import (Case, Exists, F, IntegerField, OuterRef, Q,
+                              Subquery, Value, When)
+from django.db.models.functions import Coalesce
+
+from .models import Recipe, RecipesIngredients
+
+SEARCH_CONFIG = settings.RECIPE_SEARCH_CONFIG
+SEARCH_INDEX = 'recipe_search_vector_idx'
+
+
+def full_text_search_enabled():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    ingredient_names = RecipesIngredients.objects.filter(
+        formula=OuterRef('pk')
+    ).values('formula').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(Subquery(ingredient_names), Value('')),
+            weight='B', config=SEARCH_CONFIG
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset=None):
+    """Пересчитывает search_vector рецептов queryset (по умолчанию всех)."""
+    if not full_text_search_enabled():
+        return 0
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    return queryset.update(search_vector=search_vector())
+
+
+def create_search_index(using, **kwargs):
+    """GIN-индекс по search_vector; Meta.indexes создал бы его и в SQLite."""
+    if connections[using].vendor != 'postgresql':
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'CREATE INDEX IF NOT EXISTS {SEARCH_INDEX} '
+            f'ON {Recipe._meta.db_table} USING gin (search_vector)'
+        )
+
+
+def search_recipes(queryset, text):
+    """Рецепты, подходящие под запрос, лучшие совпадения первыми."""
+    if full_text_search_enabled():
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).order_by('-search_rank', *Recipe._meta.ordering, 'id')
+    for word in text.split():
+        queryset = queryset.filter(
+            Q(name__icontains=word)
+            | Q(text__icontains=word)
+            | Exists(RecipesIngredients.objects.filter(
+                formula=OuterRef('pk'), ingredient__name__icontains=word
+            ))
+        )
+    return queryset.annotate(
+        search_rank=Case(
+            When(name__icontains=text, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ).order_by('-search_rank', *Recipe._meta.ordering, 'id')
@@ -0,0 +1,142 @@
+from functools import partial
+from threading import local
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from users.models import Follow
+
+from .cache_versions import (ALL_RECIPES_VERSION, COMMON_RECIPES_VERSION,
+                             bump_versions, recipe_version, recipe_versions,
+                             user_version)
+from .ingredient_index import invalidate_ingredient_index
+from .models import (Favorite, Ingredients, Recipe, RecipesIngredients,
+                     ShoppingCart, Tag)
+from .pantry_index import update_pantry_index
+from .search import update_search_vectors
+from .tag_registry import invalidate_tag_registry
+
+User = get_user_model()
+
+
+_changed = local()
+
+
+def bump_recipe_versions(recipe_ids):
+    authors = dict(Recipe.objects.filter(
+        pk__in=recipe_ids
+    ).values_list('id', 'author_id'))
+    versions = {ALL_RECIPES_VERSION}
+    for recipe_id in recipe_ids:
+        if recipe_id in authors:
+            versions.update(recipe_versions(recipe_id, authors[recipe_id]))
+        else:
+            versions.add(recipe_version(recipe_id))
+    bump_versions(*sorted(versions))
+
+
+def refresh_changed_recipes():
+    """Обновляет рецепты, собранные schedule_recipe_refresh.
+
+    Первый вызов после коммита обрабатывает все рецепты сразу,
+    остальные ничего не делают.
+    """
+    recipe_ids = getattr(_changed, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _changed.recipe_ids = set()
+    update_search_vectors(Recipe.objects.filter(pk__in=recipe_ids))
+    bump_recipe_versions(recipe_ids)
+    for recipe_id in sorted(recipe_ids):
+        update_pantry_index(recipe_id)
+
+
+def schedule_recipe_refresh(recipe_id):
+    """Поисковый вектор, кэши и индекс продуктов рецепта после коммита.
+
+    Рецепт обрабатывается один раз за транзакцию, сколько бы строк его
+    состава ни менялось. Рецепты из откаченной транзакции обновятся
+    вместе со следующей, это лишь лишняя работа.
+    """
+    if getattr(_changed, 'recipe_ids', None) is None:
+        _changed.recipe_ids = set()
+    _changed.recipe_ids.add(recipe_id)
+    transaction.on_commit(refresh_changed_recipes)
+
+
+@receiver((post_save, post_delete), sender=Ingredients)
+def ingredient_changed(created=False, **kwargs):
+    transaction.on_commit(invalidate_ingredient_index)
+    if not created:
+        transaction.on_commit(partial(bump_versions, COMMON_RECIPES_VERSION))
+
+
+def refresh_search_vectors(recipes):
+    transaction.on_commit(partial(update_search_vectors, recipes))
+
+
+@receiver(post_save, sender=Ingredients)
+def ingredient_renamed(instance, created, **kwargs):
+    if created:
+        return
+    refresh_search_vectors(Recipe.objects.filter(
+        recipe_ingredients__ingredient_id=instance.pk
+    ))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    transaction.on_commit(invalidate_tag_registry)
+    transaction.on_commit(partial(bump_versions, COMMON_RECIPES_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    transaction.on_commit(partial(
+        bump_versions, *recipe_versions(instance.pk, instance.author_id)
+    ))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, **kwargs):
+    schedule_recipe_refresh(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=RecipesIngredients)
+def recipe_ingredients_changed(instance, **kwargs):
+    schedule_recipe_refresh(instance.formula_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Recipe):
+        transaction.on_commit(partial(
+            bump_versions, *recipe_versions(instance.pk, instance.author_id)
+        ))
+    else:
+        transaction.on_commit(partial(bump_versions, COMMON_RECIPES_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Favorite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def user_recipes_changed(instance, **kwargs):
+    transaction.on_commit(partial(
+        bump_versions, user_version(instance.user_id)
+    ))
+
+
+@receiver((post_save, post_delete), sender=Follow)
+def follow_changed(instance, **kwargs):
+    transaction.on_commit(partial(
+        bump_versions, user_version(instance.following_id)
+    ))
+
+
+@receiver(post_save, sender=User)
+def user_changed(created, update_fields, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    transaction.on_commit(partial(bump_versions, COMMON_RECIPES_VERSION))
@@ -0,0 +1,93 @@
+"""Реестр тегов в памяти процесса."""
+import json
+from hashlib import md5
+from threading import Lock
+from types import MappingProxyType, SimpleNamespace
+
+from django.db import DEFAULT_DB_ALIAS
+
+from .cache_versions import bump_versions, get_versions
+from .models import Recipe, Tag
+
+VERSION_NAME = 'tags'
+FIELDS = ('id', 'name', 'color', 'slug')
+
+_lock = Lock()
+_state = SimpleNamespace(registry=None)
+
+
+class TagRegistry:
+    """Неизменяемый снимок всех тегов: id -> тег и slug -> id.
+
+    Теги хранятся готовыми представлениями API в порядке id. ETag
+    считается по содержимому, поэтому совпадает во всех процессах и
+    меняется только вместе с тегами.
+    """
+
+    def __init__(self, rows, version=None):
+        rows = sorted(rows, key=lambda row: row['id'])
+        self.items = MappingProxyType({
+            row['id']: MappingProxyType(row) for row in rows
+        })
+        self.slug_ids = MappingProxyType({
+            row['slug']: row['id'] for row in rows
+        })
+        self.etag = '"{}"'.format(md5(
+            json.dumps(rows, ensure_ascii=False).encode()
+        ).hexdigest())
+        self.version = version
+
+    def data(self, ids=None):
+        """Представления тегов ids (по умолчанию всех) в порядке id."""
+        if ids is None:
+            ids = self.items
+        else:
+            ids = sorted(tag_id for tag_id in ids if tag_id in self.items)
+        return [dict(self.items[tag_id]) for tag_id in ids]
+
+    def in_bulk(self, ids):
+        """Как Tag.objects.in_bulk, но без запроса к базе."""
+        return {
+            tag_id: Tag.from_db(
+                DEFAULT_DB_ALIAS, FIELDS,
+                [self.items[tag_id][field] for field in FIELDS]
+            )
+            for tag_id in ids if tag_id in self.items
+        }
+
+
+def get_tag_registry():
+    """Реестр текущей версии, при необходимости загруженный заново."""
+    version, = get_versions(VERSION_NAME)
+    with _lock:
+        if _state.registry is None or _state.registry.version != version:
+            _state.registry = TagRegistry(
+                Tag.objects.values(*FIELDS), version
+            )
+        return _state.registry
+
+
+def get_tag_slug_map():
+    return get_tag_registry().slug_ids
+
+
+def invalidate_tag_registry():
+    """Сбрасывает реестр во всех процессах через общий счётчик версий."""
+    _state.registry = None
+    bump_versions(VERSION_NAME)
+
+
+def attach_tag_ids(recipes):
+    """Проставляет recipe.tag_ids одним запросом к таблице связей.
+
+    Сами теги берутся из реестра, таблица тегов не читается.
+    """
+    tag_ids = {recipe.id: [] for recipe in recipes}
+    if not tag_ids:
+        return
+    for recipe_id, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=tag_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tag_ids[recipe_id].append(tag_id)
+    for recipe in recipes:
+        recipe.tag_ids = tag_ids[recipe.id]
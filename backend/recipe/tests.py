@@ -0,0 +1,47 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from .management.commands.explain_recipe_filters import (explain_filter,
+                                                         filter_cases,
+                                                         sequential_scans)
+
+# Индекс (author, pub_date, id) или индекс внешнего ключа author.
+AUTHOR_INDEX = r'recipe_author_pub_date_idx|recipe_recipe_author_id_\w+'
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class RecipeFilterPlanTest(TestCase):
+    """Основные фильтры ленты рецептов читают большие таблицы по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed_benchmark', users=300, recipes=3000, stdout=StringIO()
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_filters_use_indexes(self):
+        user, cases = filter_cases()
+        for title, query in cases.items():
+            with self.subTest(title):
+                plan = explain_filter(query, user)
+                self.assertEqual(sequential_scans(plan), [], plan)
+
+    def test_author_filters_search_author_index(self):
+        user, cases = filter_cases()
+        for title in ('автор', 'несколько авторов', 'автор и тег'):
+            with self.subTest(title):
+                plan = explain_filter(cases[title], user)
+                self.assertRegex(plan, AUTHOR_INDEX)
@@ -0,0 +1,43 @@
+"""Аутентификация по токену с кэшированием пользователя."""
+from hashlib import sha256
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+
+
+def token_cache_key(key):
+    return 'auth-token:' + sha256(key.encode()).hexdigest()
+
+
+def invalidate_tokens(keys):
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, хранящий пару (пользователь, токен) в кэше.
+
+    Запрос Token join User выполняется только при промахе кэша. Записи
+    живут AUTH_TOKEN_CACHE_TIMEOUT секунд и удаляются сигналами при
+    удалении токена (выход через djoser) и при сохранении пользователя
+    (смена пароля, деактивация). Сигнал очищает кэш только там, где он
+    сработал, поэтому кэширование включено лишь с общим для всех
+    процессов кэшем (Redis, Memcached): с локальным кэшем другие воркеры
+    ещё принимали бы отозванный токен.
+    """
+
+    cache_timeout = settings.AUTH_TOKEN_CACHE_TIMEOUT
+    cache_enabled = (
+        settings.CACHES['default']['BACKEND']
+        not in settings.PROCESS_LOCAL_CACHE_BACKENDS
+    )
+
+    def authenticate_credentials(self, key):
+        if not self.cache_enabled:
+            return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        credentials = cache.get(cache_key)
+        if credentials is None:
+            credentials = super().authenticate_credentials(key)
+            cache.set(cache_key, credentials, self.cache_timeout)
+        return credentials
@@ -0,0 +1,25 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .models import User
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    transaction.on_commit(partial(invalidate_tokens, [instance.key]))
+
+
+@receiver(post_save, sender=User)
+def user_changed(instance, created, update_fields, **kwargs):
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+    if keys:
+        transaction.on_commit(partial(invalidate_tokens, keys))